@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import torch
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class _Request:
+    def __init__(self, session_id: str, prompt: str, max_new_tokens: int, future: asyncio.Future):
+        self.session_id = session_id
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.future = future
+        self.queued_at = time.perf_counter()
+
+
+class ServingEngine:
+    """Serves many chat sessions from one model by batching their generate calls.
+
+    Queued requests are grouped into one left-padded batch of up to
+    ``max_batch_size``, waiting at most ``max_wait_ms`` for it to fill.
+    Every session keeps its own token history; a session has at most one
+    request in flight, since each turn builds on the previous answer.
+    """
+
+    def __init__(self, model, tokenizer,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 20,
+        max_new_tokens: int = 256,
+        max_context: Optional[int] = None,
+        max_samples: int = 1000,
+        **generate_kwargs,
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_new_tokens = max_new_tokens
+        self.max_context = max_context or model.config.max_position_embeddings
+        self.generate_kwargs = generate_kwargs
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        eos = model.generation_config.eos_token_id
+        self._stop_ids = set(eos if isinstance(eos, list) else [eos]) | {tokenizer.pad_token_id}
+        self.histories: Dict[str, List[int]] = {}
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # One generate thread: batches run one after another off the event loop.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kumru-generate")
+        self._requests = 0
+        self._batches = 0
+        self._tokens = 0
+        self._busy = 0.0
+        self._batch_sizes = deque(maxlen=max_samples)
+        self._latencies = deque(maxlen=max_samples)
+        self._queue_waits = deque(maxlen=max_samples)
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def reset(self, session_id: str):
+        self.histories.pop(session_id, None)
+
+    async def generate(self, session_id: str, prompt: str, max_new_tokens: Optional[int] = None) -> str:
+        lock = self._session_locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            future = asyncio.get_running_loop().create_future()
+            request = _Request(session_id, prompt, max_new_tokens or self.max_new_tokens, future)
+            self._queue.put_nowait(request)
+            return await future
+
+    async def _collect(self) -> List[_Request]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return [r for r in batch if not r.future.done()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                answers = await loop.run_in_executor(self._executor, self._generate_batch, batch)
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            self._busy += finished - started
+            self._batches += 1
+            self._batch_sizes.append(len(batch))
+            for request, answer in zip(batch, answers):
+                self._requests += 1
+                self._queue_waits.append(started - request.queued_at)
+                self._latencies.append(finished - request.queued_at)
+                if not request.future.done():
+                    request.future.set_result(answer)
+
+    def _encode(self, request: _Request) -> List[int]:
+        history = self.histories.get(request.session_id, [])
+        text = "\n" + request.prompt if history else request.prompt
+        ids = history + self.tokenizer(text, add_special_tokens=not history).input_ids
+        return ids[-(self.max_context - request.max_new_tokens):]
+
+    def _generate_batch(self, batch: List[_Request]) -> List[str]:
+        sequences = [self._encode(request) for request in batch]
+        inputs = self.tokenizer.pad({"input_ids": sequences}, padding=True, return_tensors="pt").to(self.model.device)
+        with torch.inference_mode():
+            output = self.model.generate(
+                **inputs,
+                max_new_tokens=max(request.max_new_tokens for request in batch),
+                pad_token_id=self.tokenizer.pad_token_id,
+                **self.generate_kwargs,
+            )
+        answers = []
+        for request, ids, row in zip(batch, sequences, output[:, inputs["input_ids"].shape[1]:].tolist()):
+            row = row[:request.max_new_tokens]
+            # Rows that finish early are padded out to the longest one in the batch.
+            for i, token in enumerate(row):
+                if token in self._stop_ids:
+                    row = row[:i]
+                    break
+            self._tokens += len(row)
+            self.histories[request.session_id] = (ids + row)[-self.max_context:]
+            answers.append(self.tokenizer.decode(row, skip_special_tokens=True))
+        return answers
+
+    def stats(self) -> Dict:
+        latencies = list(self._latencies)
+        waits = list(self._queue_waits)
+        sizes = list(self._batch_sizes)
+        return {
+            "requests": self._requests,
+            "batches": self._batches,
+            "mean_batch_size": sum(sizes) / len(sizes) if sizes else 0.0,
+            "generated_tokens": self._tokens,
+            "tokens_per_second": self._tokens / self._busy if self._busy else 0.0,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "latency_p50": _percentile(latencies, 0.5),
+            "latency_p95": _percentile(latencies, 0.95),
+            "queue_wait_p50": _percentile(waits, 0.5),
+            "queue_wait_p95": _percentile(waits, 0.95),
+        }
+
+
+async def _benchmark(model, tokenizer, args, max_batch_size: int) -> Dict:
+    engine = ServingEngine(
+        model, tokenizer,
+        max_batch_size=max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        max_new_tokens=args.max_new_tokens,
+        do_sample=False,
+    )
+
+    async def session(index: int):
+        for turn in range(args.turns):
+            await engine.generate(f"session-{index}", f"Soru {turn}: {index} sayısının karesi nedir?")
+
+    async with engine:
+        started = time.perf_counter()
+        await asyncio.gather(*(session(i) for i in range(args.sessions)))
+        stats = engine.stats()
+        stats["wall_seconds"] = time.perf_counter() - started
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the batched serving engine")
+    parser.add_argument("--model", default="hf-internal-testing/tiny-random-LlamaForCausalLM")
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model).to("cpu").eval()
+
+    for size in (1, args.max_batch_size):
+        stats = asyncio.run(_benchmark(model, tokenizer, args, size))
+        print(f"\nmax_batch_size={size}")
+        for key, value in stats.items():
+            print(f"  {key:<18} {value:.3f}" if isinstance(value, float) else f"  {key:<18} {value}")
+
+
+if __name__ == "__main__":
+    main()
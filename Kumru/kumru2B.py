@@ -1,39 +1,167 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from typing import List, Dict
+import time
+_started = time.perf_counter()
+import argparse
+from threading import Lock, Thread
+from typing import Callable, Iterator, Optional
 from webtool import web_agent
 
 MODEL_NAME = "vngrs-ai/Kumru-2B-Base"
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-model = AutoModelForCausalLM.from_pretrained(MODEL_NAME, dtype="auto", device_map="auto")
 
-conversation_history = []
+# torch/transformers and the weights are loaded on first use, not at import.
+_load_options = {"dtype": "auto", "int8": False, "cpu": False}
+_load_lock = Lock()
+_tokenizer = None
+_model = None
+_session = None
 
-def generate_answer(prompt: str, max_length: int = 512) -> str:
-    global conversation_history
-    
-    full_prompt = "\n".join(conversation_history) + "\n" + prompt if conversation_history else prompt
-    
-    tokenized_text = tokenizer.encode_plus(
-        full_prompt,
-        return_tensors='pt',
-        return_token_type_ids=False,
-        max_length=model.config.max_position_embeddings - 64,
-        truncation=True
-    ).to(model.device)
-
-    generated_tokens = model.generate(
-        **tokenized_text,
-        max_new_tokens=max_length,
-        repetition_penalty=1.15,
-        no_repeat_ngram_size=5
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+        # ru_maxrss is in KB on Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        # Windows reports the peak working set; elsewhere fall back to current RSS.
+        return getattr(info, "peak_wset", info.rss) / 2**20
+    except ImportError:
+        return 0.0
+
+
+def _rss_mb() -> float:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        return _peak_rss_mb()
+
+
+def configure(dtype: str = "auto", int8: bool = False, cpu: bool = False):
+    """Sets how the model is loaded; must be called before the first get_model()."""
+    _load_options.update(dtype=dtype, int8=int8, cpu=cpu)
+
+
+def _load():
+    global _tokenizer, _model, _session
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    started = time.perf_counter()
+    dtype, int8, cpu = _load_options["dtype"], _load_options["int8"], _load_options["cpu"]
+    _tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    model = AutoModelForCausalLM.from_pretrained(
+        MODEL_NAME,
+        # Dynamic int8 quantizes float32 Linear weights and only runs on CPU.
+        dtype=torch.float32 if int8 else (dtype if dtype == "auto" else getattr(torch, dtype)),
+        device_map="cpu" if int8 or cpu else "auto",
+        use_safetensors=True,
+        low_cpu_mem_usage=True,
     )
-    generated_text = tokenizer.decode(generated_tokens[0], skip_special_tokens=True)
-    
-    conversation_history.extend([prompt, f"Cevap: {generated_text}"])
-    if len(conversation_history) > 10:
-        conversation_history = conversation_history[-10:]
-    
-    return generated_text
+    if int8:
+        # In place: a copy would hold a second full fp32 model while quantizing.
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    _model = model.eval()
+    _session = ChatSession(_model, _tokenizer)
+    mode = "int8" if int8 else dtype
+    print(f"⏱️ Model ({mode}) {time.perf_counter() - started:.1f} sn'de yüklendi (RSS: {_rss_mb():.0f} MB, tepe RSS: {_peak_rss_mb():.0f} MB)")
+
+
+def get_model():
+    with _load_lock:
+        if _model is None:
+            _load()
+    return _model
+
+
+def get_tokenizer():
+    get_model()
+    return _tokenizer
+
+
+def get_session() -> "ChatSession":
+    get_model()
+    return _session
+
+
+class ChatSession:
+    """Multi-turn generation that keeps the KV cache between turns.
+
+    Each turn only tokenizes and encodes the new text; the history is kept
+    as token ids together with the model's past_key_values.
+    """
+
+    def __init__(self, model, tokenizer, max_context: Optional[int] = None, keep_ratio: float = 0.75):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_context = max_context or model.config.max_position_embeddings
+        self.keep_ratio = keep_ratio
+        self.reset()
+
+    def reset(self):
+        import torch
+        self.input_ids = torch.empty((1, 0), dtype=torch.long, device=self.model.device)
+        self.past_key_values = None
+
+    def _append(self, text: str):
+        import torch
+        first = self.input_ids.shape[1] == 0
+        ids = self.tokenizer(text if first else "\n" + text, return_tensors="pt", add_special_tokens=first).input_ids
+        self.input_ids = torch.cat([self.input_ids, ids.to(self.model.device)], dim=1)
+
+    def _truncate(self, max_new_tokens: int):
+        limit = self.max_context - max_new_tokens
+        if self.input_ids.shape[1] <= limit:
+            return
+        # Dropping tokens from the front shifts every position, so the cache is rebuilt.
+        # Cut well below the limit so that happens once every few turns, not every turn.
+        self.input_ids = self.input_ids[:, -int(limit * self.keep_ratio):]
+        self.past_key_values = None
+
+    def stream(self, prompt: str, max_new_tokens: int = 512) -> Iterator[str]:
+        import torch
+        from transformers import TextIteratorStreamer
+        self._append(prompt)
+        self._truncate(max_new_tokens)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        result = {}
+
+        def run():
+            try:
+                result["output"] = self.model.generate(
+                    input_ids=self.input_ids,
+                    attention_mask=torch.ones_like(self.input_ids),
+                    past_key_values=self.past_key_values,
+                    max_new_tokens=max_new_tokens,
+                    repetition_penalty=1.15,
+                    no_repeat_ngram_size=5,
+                    streamer=streamer,
+                    return_dict_in_generate=True,
+                )
+            except Exception as e:
+                result["error"] = e
+                streamer.end()
+
+        thread = Thread(target=run)
+        thread.start()
+        for text in streamer:
+            yield text
+        thread.join()
+        if "error" in result:
+            raise result["error"]
+        self.input_ids = result["output"].sequences
+        self.past_key_values = result["output"].past_key_values
+
+
+def generate_answer(prompt: str, max_length: int = 512, on_token: Optional[Callable[[str], None]] = None) -> str:
+    pieces = []
+    for text in get_session().stream(prompt, max_new_tokens=max_length):
+        pieces.append(text)
+        if on_token:
+            on_token(text)
+    return "".join(pieces)
 
 PROMPT_TEMPLATE = """Aşağıdaki web arama sonuçlarına dayanarak soruyu yanıtlayın. Yanıtınız bilgilendirici, doğru ve Türkçe olmalıdır.
 Web Arama Sonuçları:
@@ -43,19 +171,29 @@ Soru: {question} ?
 Cevap:
 """
 
-def ai_websearch_answer(query: str, num_results: int = 2, fetch_content: bool = True) -> str:
+def ai_websearch_answer(query: str, num_results: int = 2, fetch_content: bool = True, on_token: Optional[Callable[[str], None]] = None) -> str:
     print(f"\n{'='*50}\nSoru: {query}\n{'='*50}\n")
     print("🔍 Web araması yapılıyor...")
 
-    search_results = web_agent(query)
+    search_results = web_agent(query, num_results=num_results, fetch_content=fetch_content)
 
     prompt = PROMPT_TEMPLATE.format(question=query, search_results=search_results)
     print("🤖 AI yanıt üretiliyor...\n")
     
-    return generate_answer(prompt)
+    return generate_answer(prompt, on_token=on_token)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kumru AI")
+    parser.add_argument("--dtype", default="auto", choices=["auto", "bfloat16", "float16", "float32"])
+    parser.add_argument("--int8", action="store_true", help="Dynamic int8 quantized weights (CPU)")
+    parser.add_argument("--cpu", action="store_true", help="Run on CPU only")
+    args = parser.parse_args()
+    configure(args.dtype, args.int8, args.cpu)
+
     print("Kumru AI\n" + "="*50)
+    print(f"🚀 Başlatma: {time.perf_counter() - _started:.2f} sn (RSS: {_rss_mb():.0f} MB)")
+    # Load the weights while the user is typing the first question.
+    Thread(target=get_model, daemon=True).start()
     print("Komutlar: 'q' (çık), 'reset' (hafızayı temizle)")
     
     while True:
@@ -66,7 +204,8 @@ if __name__ == "__main__":
             break
         
         if user_query.lower() == 'reset':
-            conversation_history.clear()
+            if _session is not None:
+                _session.reset()
             print("✅ Konuşma hafızası temizlendi.")
             continue
         
@@ -74,7 +213,8 @@ if __name__ == "__main__":
             continue
         
         try:
-            answer = ai_websearch_answer(user_query, num_results=2)
-            print(f"\n{'='*50}\n\033[92m💬 YANIT:\033[0m\n{'='*50}\n\033[92m{answer}\033[0m\n{'='*50}\n")
+            print(f"\n{'='*50}\n\033[92m💬 YANIT:\033[0m\n{'='*50}\n\033[92m", end="", flush=True)
+            ai_websearch_answer(user_query, num_results=2, on_token=lambda text: print(text, end="", flush=True))
+            print(f"\033[0m\n{'='*50}\n")
         except Exception as e:
             print(f"❌ Hata oluştu: {e}")
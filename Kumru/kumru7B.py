@@ -1,7 +1,10 @@
+import argparse
 import asyncio
+import json
+from typing import AsyncIterator, List, Tuple
 from pydoll.browser import Chrome
 from pydoll.constants import By
-from webtool import web_agent
+from webtool import get_search
 
 PROMPT_TEMPLATE = """
 Web Arama Sonuçları:
@@ -17,21 +20,82 @@ Soru: {question}
 Cevap:
 """
 
-async def main():
+MESSAGE_SELECTOR = 'div.flex.items-start'
+
+# Plain expressions (no "return") so they evaluate the same however the script is wrapped.
+_COUNT_SCRIPT = f"document.querySelectorAll('{MESSAGE_SELECTOR}').length"
+_READ_SCRIPT = (
+    f"JSON.stringify(Array.from(document.querySelectorAll('{MESSAGE_SELECTOR}')).slice(%d).map(d => "
+    "[d.className.includes('justify-end'), Array.from(d.querySelectorAll('p')).map(p => p.innerText).join('\\n').trim()]))"
+)
+
+
+def _value(response):
+    return response['result']['result'].get('value')
+
+
+class MessageWatcher:
+    """Follows the chat by polling the DOM instead of sleeping a fixed time.
+
+    Only message nodes after the last seen index are read. The newest bot
+    message is streamed as it grows and counts as finished once its text has
+    not changed for ``settle`` seconds. Works on any page with the same
+    markup, e.g. a local static HTML file.
+    """
+
+    def __init__(self, tab, poll_interval: float = 0.2, settle: float = 1.5, timeout: float = 120):
+        self.tab = tab
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.timeout = timeout
+        self.seen = 0
+
+    async def sync(self):
+        self.seen = _value(await self.tab.execute_script(_COUNT_SCRIPT)) or 0
+
+    async def _read(self) -> List[Tuple[bool, str]]:
+        return json.loads(_value(await self.tab.execute_script(_READ_SCRIPT % self.seen)) or '[]')
+
+    async def reply(self) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        last = ''
+        changed_at = loop.time()
+        while loop.time() < deadline:
+            messages = await self._read()
+            replies = [text for is_user, text in messages if not is_user]
+            text = replies[-1] if replies else ''
+            now = loop.time()
+            if text != last:
+                # A re-rendered message that no longer extends the old text is sent whole.
+                yield text[len(last):] if text.startswith(last) else '\n' + text
+                last = text
+                changed_at = now
+            elif text and now - changed_at >= self.settle:
+                self.seen += len(messages)
+                return
+            await asyncio.sleep(self.poll_interval)
+        raise asyncio.TimeoutError('Bot yanıtı zaman aşımına uğradı')
+
+
+async def main(url: str = 'https://kumru.ai/'):
     browser = Chrome()
     tab = await browser.start()
 
-    async with tab.expect_and_bypass_cloudflare_captcha(
-        custom_selector=(By.ID, 'TAYH8'),
-        time_before_click=5,
-    ):
-        await tab.go_to('https://kumru.ai/')
+    if url.startswith('https://kumru.ai'):
+        async with tab.expect_and_bypass_cloudflare_captcha(
+            custom_selector=(By.ID, 'TAYH8'),
+            time_before_click=5,
+        ):
+            await tab.go_to(url)
+    else:
+        await tab.go_to(url)
 
     kabul_btn = await tab.find(text='Kabul Ediyorum', raise_exc=False)
     if kabul_btn:
         await kabul_btn.click()
 
-    seen_texts = set()
+    watcher = MessageWatcher(tab)
     message_count = 0
 
 
@@ -43,7 +107,7 @@ async def main():
         # Web araması yap
         print("🔍 Web araması yapılıyor...")
         try:
-            search_results = await asyncio.to_thread(web_agent, user_msg)
+            search_results = await get_search().search(user_msg)
         except Exception as e:
             print(f"❌ Hata oluştu: {e}")
             continue
@@ -51,6 +115,8 @@ async def main():
         # Promptu oluştur
         prompt = PROMPT_TEMPLATE.format(question=user_msg, search_results=search_results)
 
+        await watcher.sync()
+
         # Promptu input alanına gönder
         mesaj_input = await tab.find(id='message-input', raise_exc=False)
         if mesaj_input:
@@ -61,45 +127,19 @@ async def main():
         if send_btn:
             await send_btn.click()
 
-        await asyncio.sleep(3)
-
-        message_containers = await tab.find(
-            tag_name='div',
-            class_name='flex items-start',
-            find_all=True,
-            raise_exc=False,
-        )
-
-        if message_containers:
-            new_messages = []
-
-            for msg_div in message_containers:
-                class_attr = msg_div.class_name or ''
-                is_user = 'justify-end' in class_attr
-                sender = 'Kullanici' if is_user else 'Bot'
-
-                p_tag = await msg_div.find(tag_name='p', raise_exc=False)
-                if not p_tag:
-                    continue
-
-                text_content = (await p_tag.text).strip()
-                if not text_content:
-                    continue
-
-                signature = (sender, text_content)
-                if signature in seen_texts:
-                    continue
-
-                seen_texts.add(signature)
-                message_count += 1
-                new_messages.append((message_count, sender, text_content))
-
-            if new_messages:
-                for order, sender, text in new_messages:
-                    print(f'{order}. {sender}: {text}')
+        message_count += 2
+        print(f'{message_count}. Bot: ', end='', flush=True)
+        try:
+            async for delta in watcher.reply():
+                print(delta, end='', flush=True)
+        except asyncio.TimeoutError as e:
+            print(f"\n❌ {e}")
+        print()
 
     await browser.stop()
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description='Kumru web sohbeti')
+    parser.add_argument('--url', default='https://kumru.ai/', help='Sohbet sayfası (yerel test için file:// adresi)')
+    asyncio.run(main(parser.parse_args().url))
@@ -1,14 +1,153 @@
-from g4f.client import Client
-from g4f.Provider import Mintlify
+import asyncio
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Protocol, Tuple
 
-def web_agent(user_input):
-    client = Client(provider=Mintlify)
-    response = client.chat.completions.create(
-        messages=[{"role": "user", "content": f"Plain text ve Türkçe olarak yanıt ver.: {user_input}"}],
-        web_search=True
-    )
-    return response.choices[0].message.content
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_cache.json")
+
+
+def normalize_query(query: str) -> str:
+    # "Güneş neden sarı?" and "  güneş NEDEN sarı " share one cache entry.
+    return " ".join(query.casefold().split()).rstrip("?!. ")
+
+
+class SearchProvider(Protocol):
+    async def search(self, query: str, num_results: int = 2, fetch_content: bool = True) -> str:
+        ...
+
+
+class G4FProvider:
+    def __init__(self, provider=None):
+        # g4f is slow to import and kumru2B imports this module at startup.
+        from g4f.client import AsyncClient
+        from g4f.Provider import Mintlify
+        # One client for every search instead of a new one per call.
+        self.client = AsyncClient(provider=provider or Mintlify)
+
+    async def search(self, query, num_results=2, fetch_content=True):
+        detail = "Kaynakların içeriğini ayrıntılı özetle." if fetch_content else "Kısa yanıt ver."
+        response = await self.client.chat.completions.create(
+            messages=[{"role": "user", "content": f"Plain text ve Türkçe olarak yanıt ver. En fazla {num_results} kaynak kullan. {detail}: {query}"}],
+            web_search=True
+        )
+        return response.choices[0].message.content
+
+
+class SearchCache:
+    """Query -> result cache with a TTL, bounded to ``max_entries`` (LRU), saved to a JSON file."""
+
+    def __init__(self, path: Optional[str] = CACHE_PATH, ttl: float = 6 * 3600, max_entries: int = 256):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, expires, text in entries[-self.max_entries:]:
+            if expires > now:
+                self._items[key] = (expires, text)
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([[key, expires, text] for key, (expires, text) in self._items.items()], f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str) -> Optional[str]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.time():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return item[1]
+
+    def put(self, key: str, text: str):
+        self._items[key] = (time.time() + self.ttl, text)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+        self._save()
+
+
+class WebSearch:
+    """Async web search with caching, coalescing of identical queries and timeouts."""
+
+    def __init__(self, provider: Optional[SearchProvider] = None, cache: Optional[SearchCache] = None, timeout: float = 60):
+        self.provider = provider or G4FProvider()
+        self.cache = cache if cache is not None else SearchCache()
+        self.timeout = timeout
+        self._inflight: Dict[Tuple[str, int, bool], asyncio.Future] = {}
+
+    async def search(self, query: str, num_results: int = 2, fetch_content: bool = True) -> str:
+        key = (normalize_query(query), num_results, fetch_content)
+        cache_key = json.dumps(key, ensure_ascii=False)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(query, num_results, fetch_content, cache_key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # A caller giving up must not cancel the search for everyone else waiting on it.
+        return await asyncio.shield(task)
+
+    async def _fetch(self, query, num_results, fetch_content, cache_key) -> str:
+        text = await asyncio.wait_for(self.provider.search(query, num_results, fetch_content), self.timeout)
+        if text:
+            self.cache.put(cache_key, text)
+        return text
+
+    async def search_many(self, queries: List[str], num_results: int = 2, fetch_content: bool = True) -> str:
+        results = await asyncio.gather(
+            *(self.search(query, num_results, fetch_content) for query in queries),
+            return_exceptions=True,
+        )
+        sections = []
+        seen = set()
+        for query, result in zip(queries, results):
+            if isinstance(result, BaseException) or not result:
+                continue
+            # Sub-queries often return the same paragraphs; keep each one once.
+            paragraphs = [p for p in re.split(r"\n\s*\n", result.strip()) if p not in seen]
+            seen.update(paragraphs)
+            if paragraphs:
+                sections.append(f"### {query}\n" + "\n\n".join(paragraphs))
+        if not sections:
+            errors = [r for r in results if isinstance(r, BaseException)]
+            if errors:
+                raise errors[0]
+        return "\n\n".join(sections)
+
+
+_search: Optional[WebSearch] = None
+
+def get_search() -> WebSearch:
+    global _search
+    if _search is None:
+        _search = WebSearch()
+    return _search
+
+
+def web_agent(user_input, num_results=2, fetch_content=True):
+    return asyncio.run(get_search().search(user_input, num_results, fetch_content))
 
 if __name__ == "__main__":
     user_input = input("Bir soru girin: ")
-    print(web_agent(user_input))
\ No newline at end of file
+    print(web_agent(user_input))
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Set
+
+
+class BlobStore:
+    """Content-addressed store: each blob lives once at ``<dir>/<sha[:2]>/<sha>``."""
+
+    def __init__(self, directory: str, max_cached_bytes: int = 32 * 1024 * 1024):
+        self.directory = directory
+        self.max_cached_bytes = max_cached_bytes
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        else:
+            # Fresh blobs are safe from sweep() until the record that refers to them is written.
+            os.utime(path)
+        self._remember(digest, data)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with self._lock:
+            data = self._cache.get(digest)
+            if data is not None:
+                self._cache.move_to_end(digest)
+                return data
+        with open(self.path(digest), "rb") as f:
+            data = f.read()
+        self._remember(digest, data)
+        return data
+
+    def _remember(self, digest: str, data: bytes):
+        if len(data) > self.max_cached_bytes:
+            return
+        with self._lock:
+            if digest in self._cache:
+                self._cache.move_to_end(digest)
+                return
+            self._cache[digest] = data
+            self._cached_bytes += len(data)
+            while self._cached_bytes > self.max_cached_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+
+    def sweep(self, referenced: Set[str], min_age: float = 3600) -> int:
+        """Deletes blobs not in ``referenced`` that were last stored over ``min_age`` seconds ago."""
+        cutoff = time.time() - min_age
+        removed = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name in referenced:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) >= cutoff:
+                        continue
+                    os.remove(path)
+                except OSError:
+                    continue
+                removed += 1
+                with self._lock:
+                    data = self._cache.pop(name, None)
+                    if data is not None:
+                        self._cached_bytes -= len(data)
+        return removed
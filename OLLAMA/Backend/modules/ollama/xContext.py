@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+try:
+    from .xStore import ConversationState
+except ImportError:
+    from xStore import ConversationState
+
+IMAGE_TOKENS = 256
+MESSAGE_OVERHEAD = 4
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+Summarizer = Callable[[List[Dict], Optional[str]], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+class ContextBuilder:
+    def __init__(self,
+        token_budget: int = 6144,
+        tokenizer: Callable[[str], int] = estimate_tokens,
+        summarizer: Optional[Summarizer] = None,
+        max_cached: int = 10000,
+        stable_prefix: bool = True,
+        low_water: float = 0.5,
+        max_images: int = 1,
+    ):
+        self.token_budget = token_budget
+        self.tokenizer = tokenizer
+        self.summarizer = summarizer
+        self.max_cached = max_cached
+        self.stable_prefix = stable_prefix
+        self.low_water = low_water
+        self.max_images = max_images
+        self._tokens: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+
+    def _count_text(self, message: Dict) -> int:
+        key = (message.get("role", ""), message.get("content", ""))
+        tokens = self._tokens.get(key)
+        if tokens is None:
+            tokens = MESSAGE_OVERHEAD + self.tokenizer(key[1])
+            self._tokens[key] = tokens
+            if len(self._tokens) > self.max_cached:
+                self._tokens.popitem(last=False)
+        return tokens
+
+    def count(self, message: Dict) -> int:
+        images = message.get("images") or message.get("image_refs") or ()
+        return self._count_text(message) + IMAGE_TOKENS * len(images)
+
+    def _costs(self, history: List[Dict]) -> List[int]:
+        # Only the newest max_images history images are sent; older ones cost nothing.
+        costs = []
+        images = self.max_images
+        for message in reversed(history):
+            cost = self._count_text(message)
+            refs = message.get("images") or message.get("image_refs") or ()
+            if refs and images > 0:
+                attached = min(len(refs), images)
+                cost += IMAGE_TOKENS * attached
+                images -= attached
+            costs.append(cost)
+        costs.reverse()
+        return costs
+
+    def select(self, state: ConversationState, history: List[Dict], new_message: Dict) -> Tuple[int, Optional[Dict]]:
+        budget = self.token_budget - self.count(state.system) - self.count(new_message)
+        summary = None
+        if state.summary:
+            summary = {"role": "system", "content": SUMMARY_PREFIX + state.summary}
+            cost = self.count(summary)
+            if cost <= budget // 2:
+                budget -= cost
+            else:
+                summary = None
+        costs = self._costs(history)
+        start = None
+        if self.stable_prefix:
+            # Keep the previous window start while everything after it fits, so
+            # the prompt only grows at the end and Ollama can reuse its KV cache.
+            kept = self._opening(history, max(0, state.window_start - state.base))
+            if sum(costs[kept:]) <= budget:
+                start = kept
+            else:
+                # Overflowing: drop a large chunk at once rather than one turn per request.
+                budget = int(budget * self.low_water)
+        if start is None:
+            start = self._fit(history, costs, budget)
+        state.window_start = state.base + start
+        if summary is not None and (state.base + start == 0 or state.summary_upto > state.base + start):
+            summary = None
+        return start, summary
+
+    @staticmethod
+    def _opening(history: List[Dict], start: int) -> int:
+        # Never open the window on an assistant reply without its question.
+        while start < len(history) and history[start].get("role") != "user":
+            start += 1
+        return start
+
+    def _fit(self, history: List[Dict], costs: List[int], budget: int) -> int:
+        start = len(history)
+        while start > 0:
+            cost = costs[start - 1]
+            if cost > budget:
+                break
+            budget -= cost
+            start -= 1
+        return self._opening(history, start)
+
+    def needs_summary(self, state: ConversationState, start: int) -> bool:
+        return self.summarizer is not None and state.base + start > state.summary_upto
+
+    async def refresh_summary(self, state: ConversationState, history: List[Dict], start: int):
+        upto = state.base + start
+        dropped = history[max(0, state.summary_upto - state.base):start]
+        if not dropped:
+            return
+        summary = await self.summarizer(dropped, state.summary)
+        if summary and upto > state.summary_upto:
+            state.summary = summary
+            state.summary_upto = upto
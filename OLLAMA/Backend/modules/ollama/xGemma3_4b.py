@@ -1,47 +1,206 @@
 
 import asyncio
+import atexit
+import threading
+import time
 import uuid
-import base64
-from typing import AsyncGenerator, Dict, List, Optional, Tuple, Union
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import AsyncGenerator, Callable, Dict, List, Optional, Tuple, Union
 from ollama import AsyncClient
-import httpx
 import json
 import os
 
+try:
+    from .xBlobs import BlobStore
+    from .xContext import ContextBuilder, Summarizer, estimate_tokens
+    from .xImages import ImageFetcher
+    from .xMetrics import metrics
+    from .xScheduler import ConversationLocks, Scheduler
+    from .xStore import ConversationLog, ConversationState, message_size
+except ImportError:
+    from xBlobs import BlobStore
+    from xContext import ContextBuilder, Summarizer, estimate_tokens
+    from xImages import ImageFetcher
+    from xMetrics import metrics
+    from xScheduler import ConversationLocks, Scheduler
+    from xStore import ConversationLog, ConversationState, message_size
+
 _client = AsyncClient()
 
 CONV_DIR = os.path.join(os.path.dirname(__file__), "conversations")
 os.makedirs(CONV_DIR, exist_ok=True)
+IMAGE_CACHE_DIR = os.path.join(os.path.dirname(__file__), "image_cache")
+
+# Pinned on every request: a changing num_ctx or an unloaded model throws away Ollama's KV cache.
+DEFAULT_OPTIONS = {"num_ctx": 8192}
+KEEP_ALIVE = "30m"
+
+DEFAULT_SYSTEM = {'role': 'system', 'content': "You are a helpful and concise assistant. Detect the user's language from their request and always respond in the same language."}
 
 class ConversationManager:
-    def __init__(self, max_size_bytes: int = 128000):
+    def __init__(self,
+        max_size_bytes: int = 128000,
+        directory: str = CONV_DIR,
+        max_cached: int = 256,
+        max_cached_bytes: int = 64 * 1024 * 1024,
+        max_history_images: int = 1,
+        token_budget: int = 6144,
+        tokenizer: Callable[[str], int] = estimate_tokens,
+        summarizer: Optional[Summarizer] = None,
+        flush_interval: float = 0.5,
+        fsync: str = "batch",
+    ):
+        if fsync not in ("never", "batch", "always"):
+            raise ValueError(f"Unknown fsync policy: {fsync}")
         self.max_size_bytes = max_size_bytes * 5
+        self.max_cached = max_cached
+        self.max_cached_bytes = max_cached_bytes
+        self.max_history_images = max_history_images
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "flushes": 0, "flushed_records": 0}
+        self._blobs = BlobStore(os.path.join(directory, "blobs"))
+        self._store = ConversationLog(directory, DEFAULT_SYSTEM, blobs=self._blobs)
+        self.context = ContextBuilder(token_budget, tokenizer, summarizer, max_images=max_history_images)
+        self._summary_tasks: Dict[str, asyncio.Task] = {}
+        self._cache: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._pending: Dict[str, List[Dict]] = {}
+        self._pending_lock = threading.Lock()
+        # Per conversation: a load never misses records another thread is still writing.
+        self._write_locks: Dict[str, threading.Lock] = {}
+        self._writes: Dict[str, asyncio.Future] = {}
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="conv-flush", daemon=True)
+        self._flusher.start()
 
     def _get_conv_path(self, conv_id: str) -> str:
-        return os.path.join(CONV_DIR, f"{conv_id}.json")
+        return self._store.log_path(conv_id)
 
-    def _load_conversation(self, conv_id: str) -> Dict:
-        path = self._get_conv_path(conv_id)
-        if not os.path.exists(path):
-            return {
-                "system": {'role': 'system', 'content': "You are a helpful and concise assistant. Detect the user's language from their request and always respond in the same language."},
-                "history": []
-            }
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+    def _get_state(self, conv_id: str) -> ConversationState:
+        state = self._cache.get(conv_id)
+        if state is not None:
+            self._cache.move_to_end(conv_id)
+            self.stats["hits"] += 1
+            metrics.inc("conversation_cache_total", result="hit")
+            return state
+        self.stats["misses"] += 1
+        metrics.inc("conversation_cache_total", result="miss")
+        return self._cache_state(conv_id, self._load_state(conv_id))
 
-    def _save_conversation(self, conv_id: str, conversation: Dict):
-        path = self._get_conv_path(conv_id)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(conversation, f, ensure_ascii=False)
+    async def load(self, conv_id: str):
+        """Caches the conversation, reading it from disk on a worker thread on a miss."""
+        if conv_id in self._cache:
+            return
+        self.stats["misses"] += 1
+        metrics.inc("conversation_cache_total", result="miss")
+        state = await asyncio.to_thread(self._load_state, conv_id)
+        if conv_id not in self._cache:
+            self._cache_state(conv_id, state)
+
+    def _cache_state(self, conv_id: str, state: ConversationState) -> ConversationState:
+        self._cache[conv_id] = state
+        self._evict()
+        return state
+
+    def _load_state(self, conv_id: str) -> ConversationState:
+        with self._write_lock(conv_id), metrics.span("conversation_load"):
+            # An evicted entry may still have records waiting for the flusher.
+            self._write_one(conv_id)
+            return self._store.load(conv_id)
+
+    def _evict(self):
+        while len(self._cache) > 1 and (
+            len(self._cache) > self.max_cached
+            or sum(s.total for s in self._cache.values()) > self.max_cached_bytes
+        ):
+            self._cache.popitem(last=False)
+            self.stats["evictions"] += 1
+            metrics.inc("conversation_evictions_total")
+
+    def _commit(self, conv_id: str, state: ConversationState, records: List[Dict]):
+        with self._pending_lock:
+            self._pending.setdefault(conv_id, []).extend(records)
+        if self.fsync == "always":
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._write_pending([conv_id])
+            else:
+                # Written and fsynced off the event loop; wait_written() awaits it.
+                self._writes[conv_id] = loop.run_in_executor(None, self._write_pending, [conv_id])
+        self._store.maybe_compact(conv_id, state)
+
+    async def wait_written(self, conv_id: str):
+        write = self._writes.pop(conv_id, None)
+        if write is not None:
+            await write
+
+    def _write_lock(self, conv_id: str) -> threading.Lock:
+        with self._pending_lock:
+            return self._write_locks.setdefault(conv_id, threading.Lock())
+
+    def _write_one(self, conv_id: str) -> bool:
+        # Caller holds the conversation's write lock.
+        with self._pending_lock:
+            records = self._pending.pop(conv_id, None)
+        if not records:
+            return False
+        try:
+            with metrics.span("conversation_write"):
+                self._store.append(conv_id, records, fsync=self.fsync != "never")
+        except OSError:
+            with self._pending_lock:
+                self._pending[conv_id] = records + self._pending.get(conv_id, [])
+            return False
+        self.stats["flushed_records"] += len(records)
+        metrics.inc("conversation_flushed_records_total", len(records))
+        return True
+
+    def _write_pending(self, conv_ids: Optional[List[str]] = None):
+        with self._pending_lock:
+            targets = list(self._pending) if conv_ids is None else [c for c in conv_ids if c in self._pending]
+        wrote = False
+        for conv_id in targets:
+            with self._write_lock(conv_id):
+                wrote = self._write_one(conv_id) or wrote
+        if wrote:
+            self.stats["flushes"] += 1
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        self._write_pending()
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def cache_stats(self) -> Dict:
+        with self._pending_lock:
+            pending = sum(len(r) for r in self._pending.values())
+        return {
+            **self.stats,
+            "cached": len(self._cache),
+            "cached_bytes": sum(s.total for s in self._cache.values()),
+            "pending_records": pending,
+        }
+
+    def _load_conversation(self, conv_id: str) -> Dict:
+        return self._get_state(conv_id).as_dict()
 
     def calculate_size(self, conversation: Dict) -> int:
         return len(json.dumps(conversation, ensure_ascii=False).encode("utf-8"))
 
     def edit_system_message(self, conv_id: str, system_message: str):
-        conversation = self._load_conversation(conv_id)
-        conversation["system"] = {"role": "system", "content": system_message}
-        self._save_conversation(conv_id, conversation)
+        state = self._get_state(conv_id)
+        system = {"role": "system", "content": system_message}
+        if state.system == system:
+            return
+        state.set_system(system)
+        self._commit(conv_id, state, [{"system": system}])
 
     def get_conversation(self, conv_id: str, ollama: bool = False) -> Dict:
         conversation = self._load_conversation(conv_id)
@@ -53,59 +212,177 @@ class ConversationManager:
                 sys_entry = system_msg
             else:
                 sys_entry = {"role": "system", "content": str(system_msg)}
-            return {"history": [sys_entry] + list(conversation.get("history", []))}
+            return {"history": [sys_entry] + self._attach_images(conversation.get("history", []))}
+
+    def _image_refs(self, history) -> List[str]:
+        refs = []
+        for entry in reversed(history):
+            if len(refs) >= self.max_history_images:
+                break
+            refs = (entry.get("image_refs") or []) + refs
+        return refs[-self.max_history_images:] if self.max_history_images > 0 else []
+
+    async def read_images(self, conv_id: str) -> Dict[str, bytes]:
+        """Reads the blobs build_messages() will attach on a worker thread."""
+        await self.load(conv_id)
+        refs = self._image_refs(self._cache[conv_id].history)
+        if not refs:
+            return {}
+        return await asyncio.to_thread(lambda: {ref: self._blobs.get(ref) for ref in refs})
+
+    def _attach_images(self, history: List[Dict], blobs: Optional[Dict[str, bytes]] = None) -> List[Dict]:
+        blobs = blobs or {}
+        messages = []
+        budget = self.max_history_images
+        for entry in reversed(history):
+            refs = entry.get("image_refs")
+            if refs is not None:
+                entry = {k: v for k, v in entry.items() if k != "image_refs"}
+                if budget > 0:
+                    refs = refs[-budget:]
+                    entry["images"] = [blobs[ref] if ref in blobs else self._blobs.get(ref) for ref in refs]
+                    budget -= len(refs)
+            messages.append(entry)
+        messages.reverse()
+        return messages
+
+    def build_messages(self, conv_id: str, user_message: Dict, images: Optional[Dict[str, bytes]] = None) -> List[Dict]:
+        state = self._get_state(conv_id)
+        history = list(state.history)
+        with metrics.span("context_select"):
+            start, summary = self.context.select(state, history, user_message)
+        messages = [state.system]
+        if summary is not None:
+            messages.append(summary)
+        messages += self._attach_images(history[start:], images)
+        messages.append(user_message)
+        return messages
+
+    def schedule_summary(self, conv_id: str, user_message: Optional[Dict] = None):
+        if self.context.summarizer is None:
+            return
+        state = self._cache.get(conv_id)
+        if state is None or conv_id in self._summary_tasks:
+            return
+        history = list(state.history)
+        start, _ = self.context.select(state, history, user_message or {"role": "user", "content": ""})
+        if not self.context.needs_summary(state, start):
+            return
+        task = asyncio.create_task(self.context.refresh_summary(state, history, start))
+        self._summary_tasks[conv_id] = task
+        task.add_done_callback(lambda t: self._summary_done(conv_id, t))
+
+    def _summary_done(self, conv_id: str, task: asyncio.Task):
+        self._summary_tasks.pop(conv_id, None)
+        if not task.cancelled():
+            # A failed summary only means older turns stay dropped without one.
+            task.exception()
+
+    def store_images(self, images: List[bytes]) -> List[str]:
+        return [self._blobs.put(image) for image in images]
 
     def add_conversation(self,
         conv_id: str,
         user_content: str,
         assistant_content: str,
         images: Optional[List[bytes]] = None,
+        image_refs: Optional[List[str]] = None,
     ):
-        conversation = self._load_conversation(conv_id)
-        while (
-            self.calculate_size(conversation) > self.max_size_bytes
-            and len(conversation["history"]) > 2
-        ):
-            conversation["history"].pop(0)
+        refs = list(image_refs or [])
+        if images:
+            refs += self.store_images(images)
+        state = self._get_state(conv_id)
+        trim = state.evict_count(self.max_size_bytes)
+        state.pop_oldest(trim)
+        metrics.inc("conversation_trimmed_messages_total", trim)
 
         user_entry = {"role": "user", "content": user_content}
-        if images:
-            user_entry["images"] = images
-        conversation["history"].append(user_entry)
-        conversation["history"].append({"role": "assistant", "content": assistant_content})
-        self._save_conversation(conv_id, conversation)
+        if refs:
+            user_entry["image_refs"] = refs
+        turn = [user_entry, {"role": "assistant", "content": assistant_content}]
+        sizes = [message_size(m) for m in turn]
+        for message, size in zip(turn, sizes):
+            state.append(message, size)
+        self._commit(conv_id, state, [{"trim": trim, "add": turn, "sizes": sizes}])
 
 
 _conv_manager = ConversationManager()
+atexit.register(_conv_manager.close)
+
+_image_fetcher = ImageFetcher(IMAGE_CACHE_DIR, max_side=896)
+
+_scheduler = Scheduler()
+_schema_cache: Dict[str, Dict] = {}
+_turn_stats: "OrderedDict[str, Dict]" = OrderedDict()
+_conv_locks = ConversationLocks()
+
+async def summarize_history(messages: List[Dict], previous: Optional[str] = None, model: str = "gemma3:4b-it-q4_K_M") -> str:
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    if previous:
+        transcript = f"Earlier summary: {previous}\n{transcript}"
+    prompt = f"Summarize this conversation in a few sentences, keeping names, facts and decisions:\n{transcript}"
+    async with _scheduler.slot(model, "summary"):
+        response = await _client.chat(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=False,
+            options=DEFAULT_OPTIONS,
+            keep_alive=KEEP_ALIVE,
+        )
+    return response.get("message", {}).get("content", "")
+
+def scheduler_stats() -> Dict[str, Dict]:
+    return _scheduler.stats()
 
 def create_schema(additional_props: Optional[Dict] = None) -> Dict:
-    props = additional_props or {}
-    props["answer"] = {
-        "type": "string",
-        "description": "Responses given in accordance with the instructions"
-    }
-    return {
-        "type": "object",
-        "properties": props,
-        "required": list(props.keys()),
-        "additionalProperties": False
-    }
-
-async def get_image_bytes(image_input: str) -> bytes:
-    if image_input.startswith(("http://", "https://", "/")):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(image_input)
-            response.raise_for_status()
-            return response.content
-    if os.path.isfile(image_input):
-        with open(image_input, "rb") as img_file:
-            return img_file.read()
-    if image_input.startswith("data:image"):
-        image_input = image_input.split(",", 1)[-1]
-    try:
-        return base64.b64decode(image_input, validate=True)
-    except Exception:
-        return image_input.encode()
+    # Same props, same schema object: keeps the request byte-identical across turns.
+    key = json.dumps(additional_props or {}, ensure_ascii=False)
+    schema = _schema_cache.get(key)
+    if schema is None:
+        props = dict(additional_props or {})
+        props["answer"] = {
+            "type": "string",
+            "description": "Responses given in accordance with the instructions"
+        }
+        schema = _schema_cache[key] = {
+            "type": "object",
+            "properties": props,
+            "required": list(props.keys()),
+            "additionalProperties": False
+        }
+    return schema
+
+def turn_stats(conv_id: str) -> Optional[Dict]:
+    return _turn_stats.get(conv_id)
+
+def _record_turn_stats(conv_id: str, messages: List[Dict], final) -> None:
+    stats = {"prompt_messages": len(messages), "prompt_tokens_estimated": sum(_conv_manager.context.count(m) for m in messages)}
+    for field in ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration", "load_duration", "total_duration"):
+        stats[field] = final.get(field) if final is not None else None
+    previous = _turn_stats.get(conv_id)
+    previous_context = previous.get("context_tokens") if previous else None
+    stats["kv_cache_reused"] = None
+    if stats["prompt_eval_count"] is not None:
+        # Ollama only counts prompt tokens it had to evaluate. Without reuse it evaluates
+        # the whole prompt, which contains at least everything the previous turn left in context.
+        reused = previous_context is not None and stats["prompt_eval_count"] < previous_context
+        stats["kv_cache_reused"] = reused if previous_context is not None else None
+        stats["context_tokens"] = (previous_context if reused else 0) + stats["prompt_eval_count"] + (stats["eval_count"] or 0)
+    if final is not None:
+        # Ollama's own timings, in nanoseconds.
+        for field, name in (("load_duration", "ollama_load_seconds"), ("prompt_eval_duration", "ollama_prompt_eval_seconds"), ("eval_duration", "ollama_eval_seconds")):
+            if final.get(field):
+                metrics.observe(name, final.get(field) / 1e9)
+        metrics.inc("ollama_prompt_tokens_total", final.get("prompt_eval_count") or 0)
+        metrics.inc("ollama_generated_tokens_total", final.get("eval_count") or 0)
+    _turn_stats[conv_id] = stats
+    _turn_stats.move_to_end(conv_id)
+    while len(_turn_stats) > 1024:
+        _turn_stats.popitem(last=False)
+
+async def get_image_bytes(image_input: Union[bytes, str]) -> bytes:
+    with metrics.span("image_fetch"):
+        return await _image_fetcher.get(image_input)
 
 async def chat(
     message: str,
@@ -115,35 +392,103 @@ async def chat(
     model: str = "gemma3:4b-it-q4_K_M",
     stream: bool = True,
     schema_props: Optional[Dict] = None,
+    timeout: Optional[float] = None,
+    on_busy: str = "wait",
+    keep_alive: Union[str, float, None] = KEEP_ALIVE,
+    options: Optional[Dict] = None,
 ) -> AsyncGenerator[Tuple[str, str], None]:
     conv_id = conversation_id or f"conv_{uuid.uuid4()}"
+    started = time.monotonic()
+    metrics.inc("chat_turns_total", model=model)
+    with metrics.span("chat_turn", model=model), metrics.profile(f"turn-{conv_id}"):
+        async with _conv_locks.hold(conv_id, wait=on_busy == "wait", timeout=timeout):
+            if timeout is not None:
+                timeout -= time.monotonic() - started
+            turn = _chat_turn(conv_id, message, image, instructions, model, stream, schema_props, timeout, keep_alive, options)
+            async with aclosing(turn):
+                async for item in turn:
+                    yield item
+
+async def _chat_turn(
+    conv_id: str,
+    message: str,
+    image: Union[bytes, str, None],
+    instructions: Optional[str],
+    model: str,
+    stream: bool,
+    schema_props: Optional[Dict],
+    timeout: Optional[float],
+    keep_alive: Union[str, float, None],
+    options: Optional[Dict],
+) -> AsyncGenerator[Tuple[str, str], None]:
+    await _conv_manager.load(conv_id)
     if instructions:
         _conv_manager.edit_system_message(conv_id, instructions)
-    messages = _conv_manager.get_conversation(conv_id, ollama=True)["history"]
     user_message = {"role": "user", "content": message}
-    image_bytes = None
+    image_refs = None
     if image:
         image_bytes = await get_image_bytes(image)
+        with metrics.span("chat_phase", phase="image_store"):
+            image_refs = await asyncio.to_thread(_conv_manager.store_images, [image_bytes])
         user_message["images"] = [image_bytes]
-    messages.append(user_message)
-    response = await _client.chat(
-        model=model,
-        messages=messages,
-        stream=stream,
-        format=create_schema(schema_props)
-    )
+    images = await _conv_manager.read_images(conv_id)
+    # Concurrent turns may have evicted the state during the awaits above.
+    await _conv_manager.load(conv_id)
+    with metrics.span("chat_phase", phase="build_messages"):
+        messages = _conv_manager.build_messages(conv_id, user_message, images)
+    with metrics.span("chat_phase", phase="schema"):
+        schema = create_schema(schema_props)
     full_response = ""
-    if stream:
-        async for chunk in response:
-            content = chunk.get("message", {}).get("content", "")
-            if content:
-                full_response += content
-                yield content, conv_id
-    else:
-        full_response = response.get("message", {}).get("content", "")
-        yield full_response, conv_id
-    images_list = [image_bytes] if image_bytes else None
-    _conv_manager.add_conversation(conv_id, message, full_response, images_list)
+    queued = time.perf_counter()
+    async with _scheduler.slot(model, conv_id, timeout=timeout) as ticket:
+        requested = time.perf_counter()
+        metrics.observe("chat_phase_seconds", requested - queued, phase="queue")
+        response = await ticket.wait(_client.chat(
+            model=model,
+            messages=messages,
+            stream=stream,
+            format=schema,
+            options={**DEFAULT_OPTIONS, **options} if options else DEFAULT_OPTIONS,
+            keep_alive=keep_alive,
+        ))
+        final = None
+        first_token = None
+        if stream:
+            try:
+                while True:
+                    try:
+                        chunk = await ticket.wait(response.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    if chunk.get("done"):
+                        final = chunk
+                        ticket.finish(chunk.get("eval_count"), chunk.get("eval_duration"))
+                    content = chunk.get("message", {}).get("content", "")
+                    if content:
+                        ticket.token()
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                            metrics.observe("chat_phase_seconds", first_token - requested, phase="first_token")
+                        full_response += content
+                        yield content, conv_id
+            finally:
+                # Closing the stream drops the HTTP request so Ollama stops generating.
+                await response.aclose()
+                if first_token is not None:
+                    metrics.observe("chat_phase_seconds", time.perf_counter() - first_token, phase="generation")
+        else:
+            full_response = response.get("message", {}).get("content", "")
+            ticket.token()
+            final = response
+            ticket.finish(response.get("eval_count"), response.get("eval_duration"))
+            yield full_response, conv_id
+    _record_turn_stats(conv_id, messages, final)
+    # The state may have been evicted while the reply streamed.
+    await _conv_manager.load(conv_id)
+    with metrics.span("chat_phase", phase="save"):
+        _conv_manager.add_conversation(conv_id, message, full_response, image_refs=image_refs)
+        await _conv_manager.wait_written(conv_id)
+    _conv_manager.schedule_summary(conv_id)
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,203 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, Union
+import httpx
+
+try:
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+CacheEntry = Tuple[float, Optional[str], bytes]
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class ImageFetcher:
+    def __init__(self,
+        cache_dir: str,
+        ttl: float = 3600,
+        max_bytes: int = 20 * 1024 * 1024,
+        max_memory_bytes: int = 32 * 1024 * 1024,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+        max_side: Optional[int] = None,
+        jpeg_quality: int = 90,
+        timeout: float = 30.0,
+    ):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self.timeout = timeout
+        self._memory: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._memory_bytes = 0
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="image-io")
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Pooled connections belong to the loop that opened them.
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                http2=_HTTP2,
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=60),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def get(self, image_input: Union[bytes, str]) -> bytes:
+        if isinstance(image_input, bytes):
+            data = image_input
+        elif image_input.startswith(("http://", "https://")):
+            data = await self._fetch_url(image_input)
+        elif os.path.isfile(image_input):
+            data = await self._run(self._read_file, image_input)
+        else:
+            if image_input.startswith("data:image"):
+                image_input = image_input.split(",", 1)[-1]
+            try:
+                data = base64.b64decode(image_input, validate=True)
+            except Exception:
+                return image_input.encode()
+        if len(data) > self.max_bytes:
+            raise ImageTooLarge(f"Image is {len(data)} bytes, limit is {self.max_bytes}")
+        if self.max_side:
+            data = await self._run(self._downscale, data)
+        return data
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def _fetch_url(self, url: str) -> bytes:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is None:
+            entry = await self._run(self._disk_get, key)
+        if entry is not None and entry[0] > now:
+            self._remember(key, entry)
+            return entry[2]
+
+        headers = {"If-None-Match": entry[1]} if entry is not None and entry[1] else {}
+        async with self._get_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and entry is not None:
+                etag, data = entry[1], entry[2]
+            else:
+                response.raise_for_status()
+                length = response.headers.get("Content-Length")
+                if length and length.isdigit() and int(length) > self.max_bytes:
+                    raise ImageTooLarge(f"{url} is {length} bytes, limit is {self.max_bytes}")
+                chunks = []
+                total = 0
+                async for chunk in response.aiter_bytes():
+                    total += len(chunk)
+                    if total > self.max_bytes:
+                        raise ImageTooLarge(f"{url} exceeds {self.max_bytes} bytes")
+                    chunks.append(chunk)
+                etag, data = response.headers.get("ETag"), b"".join(chunks)
+
+        entry = (now + self.ttl, etag, data)
+        self._remember(key, entry)
+        await self._run(self._disk_put, key, url, entry)
+        return data
+
+    def _remember(self, key: str, entry: CacheEntry):
+        if len(entry[2]) > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old[2])
+        self._memory[key] = entry
+        self._memory_bytes += len(entry[2])
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted[2])
+
+    def _disk_get(self, key: str) -> Optional[CacheEntry]:
+        base = os.path.join(self.cache_dir, key)
+        try:
+            with open(base + ".json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(base + ".bin", "rb") as f:
+                data = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta["expires"] <= time.time() and not meta.get("etag"):
+            self._disk_remove(key)
+            return None
+        return meta["expires"], meta.get("etag"), data
+
+    def _disk_put(self, key: str, url: str, entry: CacheEntry):
+        base = os.path.join(self.cache_dir, key)
+        with open(base + ".bin.tmp", "wb") as f:
+            f.write(entry[2])
+        os.replace(base + ".bin.tmp", base + ".bin")
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump({"url": url, "etag": entry[1], "expires": entry[0]}, f)
+        self._disk_evict()
+
+    def _disk_remove(self, key: str):
+        for suffix in (".bin", ".json"):
+            try:
+                os.remove(os.path.join(self.cache_dir, key + suffix))
+            except OSError:
+                pass
+
+    def _disk_evict(self):
+        blobs = []
+        with os.scandir(self.cache_dir) as it:
+            for item in it:
+                if item.name.endswith(".bin"):
+                    stat = item.stat()
+                    blobs.append((stat.st_mtime, stat.st_size, item.name[:-4]))
+        total = sum(size for _, size, _ in blobs)
+        for _, size, key in sorted(blobs):
+            if total <= self.max_disk_bytes:
+                break
+            self._disk_remove(key)
+            total -= size
+
+    def _downscale(self, data: bytes) -> bytes:
+        try:
+            from PIL import Image
+        except ImportError:
+            return data
+        try:
+            image = Image.open(io.BytesIO(data))
+            if max(image.size) <= self.max_side:
+                return data
+            image.thumbnail((self.max_side, self.max_side))
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            out = io.BytesIO()
+            image.save(out, format="JPEG", quality=self.jpeg_quality)
+        except Exception:
+            return data
+        return out.getvalue()
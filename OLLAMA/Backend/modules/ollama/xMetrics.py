@@ -0,0 +1,250 @@
+import atexit
+import bisect
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict) -> LabelKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("metrics", "name", "labels", "started")
+
+    def __init__(self, metrics: "Metrics", name: str, labels: Dict):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        labels = dict(self.labels, error=exc_type.__name__) if exc_type else self.labels
+        self.metrics.observe(f"{self.name}_seconds", duration, **labels)
+        self.metrics._emit(self.name, duration, labels)
+        return False
+
+
+class _Profile:
+    """Samples one thread's stack until exit; keeps the result only if it ran for ``threshold`` seconds.
+
+    Turns share the event-loop thread, so the samples cover whatever else
+    the loop ran meanwhile; the profiler therefore runs one at a time.
+    """
+
+    def __init__(self, profiler: "SamplingProfiler", name: str):
+        self.profiler = profiler
+        self.name = name
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._target = threading.get_ident()
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        threading.Thread(target=self._sample, name="metrics-profiler", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        try:
+            if time.perf_counter() - self.started >= self.profiler.threshold:
+                self.profiler.dump(self.name, self.stacks)
+        finally:
+            self.profiler._active.release()
+        return False
+
+    def _sample(self):
+        while not self._stop.wait(self.profiler.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+class SamplingProfiler:
+    """Writes folded stacks (flamegraph.pl / speedscope format) for slow turns."""
+
+    def __init__(self, directory: str, threshold: float = 2.0, interval: float = 0.005):
+        self.directory = directory
+        self.threshold = threshold
+        self.interval = interval
+        self._active = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def profile(self, name: str):
+        # A turn that starts while another is being profiled is not profiled.
+        if not self._active.acquire(blocking=False):
+            return _NOOP
+        return _Profile(self, name)
+
+    def dump(self, name: str, stacks: Counter):
+        name = re.sub(r"[^\w.-]", "_", name)[:100]
+        path = os.path.join(self.directory, f"{name}-{int(time.time() * 1000)}.folded")
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        except OSError:
+            pass
+
+
+class Metrics:
+    """Counters, histograms and timing spans for the backend.
+
+    Disabled by default, in which case every call returns after one
+    attribute check. Enable with ``metrics.enable()`` or ``XMETRICS=1``.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.profiler: Optional[SamplingProfiler] = None
+        self._counters: Dict[LabelKey, float] = {}
+        self._histograms: Dict[LabelKey, Histogram] = {}
+        self._lock = threading.Lock()
+        self._sink = None
+
+    def enable(self, jsonl_path: Optional[str] = None, profile_dir: Optional[str] = None, slow_turn_seconds: float = 2.0):
+        if jsonl_path:
+            # Every finished span is appended here as one JSON line.
+            self._sink = open(jsonl_path, "a", encoding="utf-8")
+            atexit.register(self._sink.close)
+        if profile_dir:
+            self.profiler = SamplingProfiler(profile_dir, slow_turn_seconds)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def span(self, name: str, **labels):
+        if not self.enabled:
+            return _NOOP
+        return Span(self, name, labels)
+
+    def profile(self, name: str):
+        if not self.enabled or self.profiler is None:
+            return _NOOP
+        return self.profiler.profile(name)
+
+    def _emit(self, name: str, duration: float, labels: Dict):
+        if self._sink is None:
+            return
+        line = json.dumps({"span": name, "ts": time.time(), "duration": duration, **labels}, ensure_ascii=False)
+        with self._lock:
+            self._sink.write(line + "\n")
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in self._counters.items()]
+            histograms = [
+                {"name": n, "labels": dict(l), "count": h.count, "sum": h.sum,
+                 "buckets": dict(zip([*map(str, h.buckets), "+Inf"], h.counts))}
+                for (n, l), h in self._histograms.items()
+            ]
+        return {"ts": time.time(), "counters": counters, "histograms": histograms}
+
+    def export_jsonl(self, path: str):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.snapshot(), ensure_ascii=False) + "\n")
+
+    def prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip([*map(str, histogram.buckets), "+Inf"], histogram.counts):
+                    cumulative += count
+                    le = 'le="%s"' % bound
+                    lines.append(f"{name}_bucket{_format_labels(labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+if os.environ.get("XMETRICS") == "1":
+    metrics.enable(
+        jsonl_path=os.environ.get("XMETRICS_JSONL"),
+        profile_dir=os.environ.get("XMETRICS_PROFILE_DIR"),
+        slow_turn_seconds=float(os.environ.get("XMETRICS_SLOW_TURN", "2.0")),
+    )
@@ -1,22 +1,135 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
 import speech_recognition as sr
 
+try:
+    from .xMetrics import metrics
+except ImportError:
+    from xMetrics import metrics
+
+_recognizer = None
+
+def google_recognize(audio: sr.AudioData) -> str:
+    return sr.Recognizer().recognize_google(audio, language="tr-TR,en-US")
+
 def recognize_speech_from_mic():
-    recognizer = sr.Recognizer()
+    global _recognizer
     mic = sr.Microphone()
     with mic as source:
+        if _recognizer is None:
+            # Calibrate once; dynamic_energy_threshold keeps adapting afterwards.
+            _recognizer = sr.Recognizer()
+            _recognizer.adjust_for_ambient_noise(source)
         print("Please say something...")
-        recognizer.adjust_for_ambient_noise(source)
-        audio = recognizer.listen(source)
+        with metrics.span("stt_listen"):
+            audio = _recognizer.listen(source)
     try:
-        text = recognizer.recognize_google(audio, language="tr-TR,en-US")
+        with metrics.span("stt_recognize"):
+            text = _recognizer.recognize_google(audio, language="tr-TR,en-US")
+        metrics.inc("stt_utterances_total", result="ok")
         print("You said:", text)
         return text
     except sr.UnknownValueError:
+        metrics.inc("stt_utterances_total", result="unknown")
         print("Sorry, could not understand the audio.")
         return ""
     except sr.RequestError:
+        metrics.inc("stt_utterances_total", result="error")
         print("Could not request results; check your internet connection.")
         return ""
 
+
+class SpeechListener:
+    """Keeps the microphone open on a background thread and queues recognized utterances.
+
+    Capture never waits for recognition, so the next utterance is being
+    recorded and recognized while the chat loop handles the previous one.
+    Pass ``source_factory=lambda: sr.AudioFile(path)`` and any
+    ``recognize`` callable to run it offline from a WAV file.
+    """
+
+    def __init__(self,
+        recognize: Callable[[sr.AudioData], str] = google_recognize,
+        source_factory: Callable[[], sr.AudioSource] = sr.Microphone,
+        calibrate_seconds: float = 1.0,
+        phrase_time_limit: Optional[float] = 15,
+    ):
+        self.recognize = recognize
+        self.source_factory = source_factory
+        self.calibrate_seconds = calibrate_seconds
+        self.phrase_time_limit = phrase_time_limit
+        self.recognizer = sr.Recognizer()
+        self.recognizer.dynamic_energy_threshold = True
+        self.paused = False
+        self._pauses = 0
+        self._stop = threading.Event()
+        # One worker keeps utterances in the order they were spoken.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stt-recognize")
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop = None
+        self._thread = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._thread = threading.Thread(target=self._capture, name="stt-capture", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def pause(self):
+        # Drop anything heard while paused, e.g. our own TTS output.
+        self._pauses += 1
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    async def get(self) -> Optional[str]:
+        return await self._queue.get()
+
+    def _push(self, text: Optional[str]):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, text)
+
+    def _capture(self):
+        try:
+            with self.source_factory() as source:
+                self.recognizer.adjust_for_ambient_noise(source, duration=self.calibrate_seconds)
+                while not self._stop.is_set():
+                    pauses = self._pauses
+                    try:
+                        audio = self.recognizer.listen(source, timeout=1, phrase_time_limit=self.phrase_time_limit)
+                    except sr.WaitTimeoutError:
+                        continue
+                    if not audio.frame_data:
+                        # End of a file source.
+                        break
+                    if self.paused or pauses != self._pauses:
+                        metrics.inc("stt_utterances_total", result="dropped")
+                        continue
+                    self._executor.submit(self._recognize, audio)
+        finally:
+            self._executor.submit(self._push, None)
+
+    def _recognize(self, audio: sr.AudioData):
+        try:
+            with metrics.span("stt_recognize"):
+                text = self.recognize(audio)
+        except sr.UnknownValueError:
+            metrics.inc("stt_utterances_total", result="unknown")
+            return
+        except sr.RequestError:
+            metrics.inc("stt_utterances_total", result="error")
+            print("Could not request results; check your internet connection.")
+            return
+        metrics.inc("stt_utterances_total", result="ok" if text else "empty")
+        if text:
+            print("You said:", text)
+            self._push(text)
+
+
 if __name__ == "__main__":
-    recognize_speech_from_mic()
\ No newline at end of file
+    recognize_speech_from_mic()
@@ -0,0 +1,227 @@
+import asyncio
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+
+class SchedulerBusy(RuntimeError):
+    pass
+
+
+class ConversationBusy(RuntimeError):
+    pass
+
+
+def _percentiles(samples: Deque[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"p50": None, "p95": None, "max": None}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50": pick(0.50), "p95": pick(0.95), "max": ordered[-1]}
+
+
+class Ticket:
+    def __init__(self, timeout: Optional[float]):
+        self.submitted = time.monotonic()
+        self.deadline = self.submitted + timeout if timeout is not None else None
+        self.started: Optional[float] = None
+        self.first_token: Optional[float] = None
+        self.tokens = 0
+        self.eval_count: Optional[int] = None
+        self.eval_duration_ns: Optional[int] = None
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    async def wait(self, awaitable):
+        remaining = self.remaining()
+        if remaining is None:
+            return await awaitable
+        if remaining <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise asyncio.TimeoutError("Request deadline exceeded")
+        return await asyncio.wait_for(awaitable, remaining)
+
+    def token(self, count: int = 1):
+        if self.first_token is None:
+            self.first_token = time.monotonic()
+        self.tokens += count
+
+    def finish(self, eval_count: Optional[int] = None, eval_duration_ns: Optional[int] = None):
+        self.eval_count = eval_count
+        self.eval_duration_ns = eval_duration_ns
+
+    def tokens_per_second(self) -> Optional[float]:
+        if self.eval_count and self.eval_duration_ns:
+            return self.eval_count / (self.eval_duration_ns / 1e9)
+        if self.first_token is None or self.tokens < 2:
+            return None
+        elapsed = time.monotonic() - self.first_token
+        return (self.tokens - 1) / elapsed if elapsed > 0 else None
+
+
+class _ModelQueue:
+    def __init__(self, limit: int, max_samples: int):
+        self.limit = limit
+        self.active = 0
+        self.queued = 0
+        # Waiters are grouped by key and served round-robin across keys.
+        self.waiting: Dict[str, Deque[asyncio.Future]] = {}
+        self.order: Deque[str] = deque()
+        self.counts = {"completed": 0, "failed": 0, "rejected": 0, "timeouts": 0, "cancelled": 0}
+        self.queue_wait: Deque[float] = deque(maxlen=max_samples)
+        self.ttft: Deque[float] = deque(maxlen=max_samples)
+        self.tokens_per_s: Deque[float] = deque(maxlen=max_samples)
+
+
+class Scheduler:
+    def __init__(self, default_limit: int = 2, max_queue: int = 64, max_samples: int = 1000):
+        self.default_limit = default_limit
+        self.max_queue = max_queue
+        self.max_samples = max_samples
+        self._limits: Dict[str, int] = {}
+        self._queues: Dict[str, _ModelQueue] = {}
+
+    def set_limit(self, model: str, limit: int):
+        self._limits[model] = limit
+        if model in self._queues:
+            self._queues[model].limit = limit
+            self._grant(self._queues[model])
+
+    def _queue(self, model: str) -> _ModelQueue:
+        queue = self._queues.get(model)
+        if queue is None:
+            limit = self._limits.get(model, self.default_limit)
+            queue = self._queues[model] = _ModelQueue(limit, self.max_samples)
+        return queue
+
+    @asynccontextmanager
+    async def slot(self, model: str, key: str, timeout: Optional[float] = None):
+        queue = self._queue(model)
+        ticket = Ticket(timeout)
+        await self._acquire(queue, key, ticket)
+        ticket.started = time.monotonic()
+        queue.queue_wait.append(ticket.started - ticket.submitted)
+        try:
+            yield ticket
+        except asyncio.TimeoutError:
+            queue.counts["timeouts"] += 1
+            raise
+        except asyncio.CancelledError:
+            queue.counts["cancelled"] += 1
+            raise
+        except GeneratorExit:
+            queue.counts["cancelled"] += 1
+            raise
+        except Exception:
+            queue.counts["failed"] += 1
+            raise
+        else:
+            queue.counts["completed"] += 1
+            if ticket.first_token is not None:
+                queue.ttft.append(ticket.first_token - ticket.submitted)
+            tokens_per_s = ticket.tokens_per_second()
+            if tokens_per_s is not None:
+                queue.tokens_per_s.append(tokens_per_s)
+        finally:
+            queue.active -= 1
+            self._grant(queue)
+
+    async def _acquire(self, queue: _ModelQueue, key: str, ticket: Ticket):
+        if queue.active < queue.limit and not queue.queued:
+            queue.active += 1
+            return
+        if queue.queued >= self.max_queue:
+            queue.counts["rejected"] += 1
+            raise SchedulerBusy(f"{queue.queued} requests already queued")
+        future = asyncio.get_running_loop().create_future()
+        if key not in queue.waiting:
+            queue.waiting[key] = deque()
+            queue.order.append(key)
+        queue.waiting[key].append(future)
+        queue.queued += 1
+        try:
+            await ticket.wait(future)
+        except BaseException as exc:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up; pass it on.
+                queue.active -= 1
+                self._grant(queue)
+            else:
+                self._discard(queue, key, future)
+            if isinstance(exc, asyncio.TimeoutError):
+                queue.counts["timeouts"] += 1
+            elif isinstance(exc, asyncio.CancelledError):
+                queue.counts["cancelled"] += 1
+            raise
+
+    def _discard(self, queue: _ModelQueue, key: str, future: asyncio.Future):
+        waiters = queue.waiting.get(key)
+        if not waiters or future not in waiters:
+            return
+        waiters.remove(future)
+        queue.queued -= 1
+        if not waiters:
+            del queue.waiting[key]
+            queue.order.remove(key)
+
+    def _grant(self, queue: _ModelQueue):
+        while queue.active < queue.limit and queue.order:
+            key = queue.order.popleft()
+            waiters = queue.waiting[key]
+            future = waiters.popleft()
+            queue.queued -= 1
+            if waiters:
+                queue.order.append(key)
+            else:
+                del queue.waiting[key]
+            if future.done():
+                continue
+            queue.active += 1
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, Dict]:
+        result = {}
+        for model, queue in self._queues.items():
+            result[model] = {
+                "limit": queue.limit,
+                "active": queue.active,
+                "queued": queue.queued,
+                "queued_keys": len(queue.waiting),
+                **queue.counts,
+                "queue_wait_s": _percentiles(queue.queue_wait),
+                "ttft_s": _percentiles(queue.ttft),
+                "tokens_per_s": _percentiles(queue.tokens_per_s),
+            }
+        return result
+
+
+class ConversationLocks:
+    def __init__(self):
+        # Locks disappear once no turn holds or waits on them.
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def locked(self, key: str) -> bool:
+        lock = self._locks.get(key)
+        return lock is not None and lock.locked()
+
+    @asynccontextmanager
+    async def hold(self, key: str, wait: bool = True, timeout: Optional[float] = None):
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        if not wait and lock.locked():
+            raise ConversationBusy(f"Conversation {key} already has a turn in progress")
+        if timeout is None:
+            await lock.acquire()
+        else:
+            await asyncio.wait_for(lock.acquire(), timeout)
+        try:
+            yield
+        finally:
+            lock.release()
@@ -0,0 +1,215 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+try:
+    from .xBlobs import BlobStore
+except ImportError:
+    from xBlobs import BlobStore
+
+_compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conv-compact")
+_DIGEST = re.compile(r"\b[0-9a-f]{64}\b")
+
+
+def message_size(message: Dict) -> int:
+    return len(json.dumps(message, ensure_ascii=False).encode("utf-8"))
+
+
+class ConversationState:
+    def __init__(self, system: Dict):
+        self.system = system
+        self.system_size = message_size(system)
+        self.history = deque()
+        self.sizes = deque()
+        self.total = self.system_size
+        self.dead = 0
+        # Messages dropped from the front since load; summaries index past them.
+        self.base = 0
+        self.summary: Optional[str] = None
+        self.summary_upto = 0
+        self.window_start = 0
+
+    def set_system(self, system: Dict, size: Optional[int] = None):
+        size = message_size(system) if size is None else size
+        self.total += size - self.system_size
+        self.system = system
+        self.system_size = size
+        self.dead += 1
+
+    def append(self, message: Dict, size: Optional[int] = None):
+        size = message_size(message) if size is None else size
+        self.history.append(message)
+        self.sizes.append(size)
+        self.total += size
+
+    def pop_oldest(self, count: int = 1):
+        for _ in range(count):
+            self.history.popleft()
+            self.total -= self.sizes.popleft()
+            self.dead += 1
+            self.base += 1
+
+    def evict_count(self, max_bytes: int, keep: int = 2) -> int:
+        total = self.total
+        count = 0
+        while total > max_bytes and len(self.history) - count > keep:
+            total -= self.sizes[count]
+            count += 1
+        return count
+
+    def as_dict(self) -> Dict:
+        return {"system": self.system, "history": list(self.history)}
+
+
+class ConversationLog:
+    """Append-only per-conversation log.
+
+    Each line is one record: ``{"system": msg}`` replaces the system message,
+    ``{"trim": n, "add": [msgs], "sizes": [bytes]}`` drops the ``n`` oldest
+    messages and appends a turn. Logs are rewritten as a snapshot in the
+    background once they hold more dead records than live messages.
+    Compaction also sweeps ``blobs`` for images no log refers to any more,
+    at most once per ``sweep_interval`` seconds.
+    """
+
+    def __init__(self,
+        directory: str,
+        default_system: Dict,
+        compact_min: int = 32,
+        blobs: Optional[BlobStore] = None,
+        sweep_interval: float = 3600,
+    ):
+        self.directory = directory
+        self.default_system = default_system
+        self.compact_min = compact_min
+        self.blobs = blobs
+        self.sweep_interval = sweep_interval
+        self._swept = time.monotonic()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._compacting = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def log_path(self, conv_id: str) -> str:
+        return os.path.join(self.directory, f"{conv_id}.jsonl")
+
+    def legacy_path(self, conv_id: str) -> str:
+        return os.path.join(self.directory, f"{conv_id}.json")
+
+    def _lock(self, conv_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(conv_id, threading.Lock())
+
+    def load(self, conv_id: str) -> ConversationState:
+        with self._lock(conv_id):
+            state = self._read(conv_id)
+            if state is None:
+                state = self._migrate(conv_id)
+        return state or ConversationState(dict(self.default_system))
+
+    def _read(self, conv_id: str) -> Optional[ConversationState]:
+        path = self.log_path(conv_id)
+        if not os.path.exists(path):
+            return None
+        state = ConversationState(dict(self.default_system))
+        state.dead = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash; append() starts the next record on a new line.
+                    continue
+                self.apply(state, record)
+        return state
+
+    def _migrate(self, conv_id: str) -> Optional[ConversationState]:
+        legacy = self.legacy_path(conv_id)
+        if not os.path.exists(legacy):
+            return None
+        with open(legacy, "r", encoding="utf-8") as f:
+            conversation = json.load(f)
+        state = ConversationState(conversation.get("system") or dict(self.default_system))
+        state.dead = 0
+        for message in conversation.get("history", []):
+            state.append(message)
+        self._write_snapshot(conv_id, state)
+        os.remove(legacy)
+        return state
+
+    @staticmethod
+    def apply(state: ConversationState, record: Dict):
+        if "system" in record:
+            state.set_system(record["system"])
+        if record.get("trim"):
+            state.pop_oldest(record["trim"])
+        if "add" in record:
+            sizes = record.get("sizes") or [None] * len(record["add"])
+            for message, size in zip(record["add"], sizes):
+                state.append(message, size)
+
+    def append(self, conv_id: str, records: List[Dict], fsync: bool = False):
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+        with self._lock(conv_id):
+            with open(self.log_path(conv_id), "ab+") as f:
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        # Don't glue this record onto a line torn by a crash.
+                        data = b"\n" + data
+                f.write(data)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def maybe_compact(self, conv_id: str, state: ConversationState):
+        if state.dead < max(self.compact_min, len(state.history)):
+            return
+        state.dead = 0
+        with self._locks_guard:
+            if conv_id in self._compacting:
+                return
+            self._compacting.add(conv_id)
+        _compactor.submit(self._compact, conv_id)
+
+    def _compact(self, conv_id: str):
+        try:
+            with self._lock(conv_id):
+                state = self._read(conv_id)
+                if state is not None:
+                    self._write_snapshot(conv_id, state)
+            if self.blobs is not None and time.monotonic() - self._swept >= self.sweep_interval:
+                self._swept = time.monotonic()
+                self.blobs.sweep(self.referenced_blobs())
+        finally:
+            with self._locks_guard:
+                self._compacting.discard(conv_id)
+
+    def referenced_blobs(self) -> Set[str]:
+        # Any digest-shaped string counts; a false match only keeps a blob alive.
+        refs = set()
+        for name in os.listdir(self.directory):
+            if not name.endswith((".jsonl", ".json")):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                    for line in f:
+                        refs.update(_DIGEST.findall(line))
+            except OSError:
+                continue
+        return refs
+
+    def _write_snapshot(self, conv_id: str, state: ConversationState):
+        path = self.log_path(conv_id)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"system": state.system}, ensure_ascii=False) + "\n")
+            if state.history:
+                record = {"add": list(state.history), "sizes": list(state.sizes)}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
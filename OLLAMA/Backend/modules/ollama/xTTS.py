@@ -1,17 +1,123 @@
-
 from gtts import gTTS
+from collections import OrderedDict
+from typing import Optional, Protocol, Tuple
+import array
 import tempfile
+import threading
+import queue
 import os
+import io
 import asyncio
 
-async def speak(text, lang='en'):
-    tts = gTTS(text=text, lang=lang)
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as fp:
-        temp_path = fp.name
-    tts.save(temp_path)
+try:
+    from .xMetrics import metrics
+except ImportError:
+    from xMetrics import metrics
+try:
+    import miniaudio
+except ImportError:
+    miniaudio = None
+try:
+    from playsound3 import playsound
+except ImportError:
+    playsound = None
+
+
+class TTSBackend(Protocol):
+    def synthesize(self, text: str, lang: str, voice: Optional[str] = None) -> bytes:
+        ...
+
+
+class GTTSBackend:
+    def synthesize(self, text, lang, voice=None):
+        # gTTS voices are regional accents selected by Google domain (e.g. "com.tr").
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=lang, tld=voice or "com").write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class AudioCache:
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[Tuple[str, str, Optional[str]], bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            audio = self._items.get(key)
+            if audio is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items.move_to_end(key)
+            return audio
+
+    def put(self, key, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._items[key] = audio
+            self._bytes += len(audio)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+
+class Player:
+    """One long-lived thread that plays queued utterances back to back."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._device = None
+        self._current = None
+        self._thread = threading.Thread(target=self._run, name="tts-player", daemon=True)
+        self._thread.start()
 
-    def play_and_remove():
-        from playsound3 import playsound
+    async def play(self, audio: bytes):
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        self._queue.put((audio, loop, done))
+        await done
+
+    def _run(self):
+        while True:
+            audio, loop, done = self._queue.get()
+            try:
+                self._play(audio)
+            except Exception as e:
+                loop.call_soon_threadsafe(_settle, done, e)
+            else:
+                loop.call_soon_threadsafe(_settle, done, None)
+
+    def _play(self, audio: bytes):
+        if miniaudio is not None:
+            if self._device is None:
+                # The device keeps running between utterances, so the tail still in
+                # its buffer when a stream ends is played instead of cut off by stop().
+                self._device = miniaudio.PlaybackDevice()
+                feed = self._feed()
+                next(feed)
+                self._device.start(feed)
+            device = self._device
+            # stream_memory() returns its generator already primed.
+            stream = miniaudio.stream_memory(audio, device.format, device.nchannels, device.sample_rate)
+            finished = threading.Event()
+            errors = []
+            self._current = (stream, finished, errors)
+            finished.wait()
+            if errors:
+                raise errors[0]
+            return
+        # Without miniaudio, playsound3 needs a file on disk.
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as fp:
+            fp.write(audio)
+            temp_path = fp.name
         try:
             playsound(temp_path)
         finally:
@@ -19,9 +125,69 @@ async def speak(text, lang='en'):
             if os.path.exists(temp_path):
                 os.remove(temp_path)
 
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, play_and_remove)
+    def _feed(self):
+        """Device callback: samples of the current utterance, silence between them."""
+        required = yield array.array("h")
+        while True:
+            current = self._current
+            if current is not None:
+                stream, finished, errors = current
+                try:
+                    chunk = stream.send(required)
+                except Exception as e:
+                    # End of stream or a decode error: either way this utterance is over.
+                    if not isinstance(e, StopIteration):
+                        errors.append(e)
+                    self._current = None
+                    finished.set()
+                else:
+                    required = yield chunk
+                    continue
+            required = yield array.array("h", [0]) * (required * self._device.nchannels)
+
+
+def _settle(future: asyncio.Future, error: Optional[Exception]):
+    if future.done():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
+
+
+backend: TTSBackend = GTTSBackend()
+cache = AudioCache()
+_player = None
+
+def _render(key) -> bytes:
+    with metrics.span("tts_synthesize"):
+        audio = backend.synthesize(*key)
+    cache.put(key, audio)
+    return audio
+
+def synthesize(text, lang='en', voice=None) -> bytes:
+    key = (text, lang, voice)
+    audio = cache.get(key)
+    metrics.inc("tts_cache_total", result="miss" if audio is None else "hit")
+    return audio if audio is not None else _render(key)
+
+async def synthesize_async(text, lang='en', voice=None) -> bytes:
+    key = (text, lang, voice)
+    audio = cache.get(key)
+    metrics.inc("tts_cache_total", result="miss" if audio is None else "hit")
+    return audio if audio is not None else await asyncio.to_thread(_render, key)
+
+async def play(audio: bytes):
+    global _player
+    if _player is None:
+        _player = Player()
+    with metrics.span("tts_play"):
+        await _player.play(audio)
+
+async def speak(text, lang='en', voice=None):
+    with metrics.span("tts_speak", lang=lang):
+        await play(await synthesize_async(text, lang, voice))
 
 if __name__ == "__main__":
     text = "güneş neden sarı renkli"
-    asyncio.run(speak(text, lang='tr'))
\ No newline at end of file
+    asyncio.run(speak(text, lang='tr'))
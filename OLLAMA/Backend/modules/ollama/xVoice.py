@@ -0,0 +1,170 @@
+import asyncio
+import json
+import re
+from typing import Any, Awaitable, Callable, List, Optional
+
+_ANSWER_KEY = re.compile(r'"answer"\s*:\s*"')
+_LANG_FIELD = re.compile(r'"lang"\s*:\s*"([^"\\]*)"')
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+class AnswerStream:
+    """Pulls the ``answer`` string out of a streamed JSON object as it arrives."""
+
+    def __init__(self):
+        self.raw = ""
+        self.lang: Optional[str] = None
+        self.done = False
+        self._pos: Optional[int] = None
+
+    def feed(self, chunk: str) -> str:
+        self.raw += chunk
+        if self.lang is None:
+            match = _LANG_FIELD.search(self.raw)
+            if match:
+                self.lang = match.group(1)
+        if self._pos is None:
+            match = _ANSWER_KEY.search(self.raw)
+            if not match:
+                return ""
+            self._pos = match.end()
+        if self.done:
+            return ""
+        return self._decode()
+
+    def _decode(self) -> str:
+        out = []
+        raw, pos = self.raw, self._pos
+        while pos < len(raw):
+            char = raw[pos]
+            if char == '"':
+                self.done = True
+                pos += 1
+                break
+            if char != "\\":
+                out.append(char)
+                pos += 1
+                continue
+            # Escapes are only decoded once complete; \ud8xx also waits for its low half.
+            if pos + 1 >= len(raw):
+                break
+            end = pos + 6 if raw[pos + 1] == "u" else pos + 2
+            if end > len(raw):
+                break
+            piece = json.loads(f'"{raw[pos:end]}"')
+            if "\ud800" <= piece <= "\udbff":
+                if end + 6 > len(raw):
+                    break
+                piece = json.loads(f'"{raw[pos:end + 6]}"')
+                end += 6
+            out.append(piece)
+            pos = end
+        self._pos = pos
+        return "".join(out)
+
+
+class SentenceSplitter:
+    def __init__(self, min_chars: int = 20):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            sentence = self._buffer[start:match.start()].strip()
+            # Short fragments ("Dr.", "1.") are merged into the next sentence.
+            if len(sentence) >= self.min_chars:
+                sentences.append(sentence)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> List[str]:
+        rest, self._buffer = self._buffer.strip(), ""
+        return [rest] if rest else []
+
+
+class SpeechPipeline:
+    """Speaks a streamed structured answer sentence by sentence.
+
+    Sentences are synthesized concurrently by up to ``workers`` jobs and
+    played strictly in order, so the first sentence starts playing while
+    later ones are still being generated or synthesized.
+    """
+
+    def __init__(self,
+        synthesize: Callable[[str, str], Awaitable[Any]],
+        play: Callable[[Any], Awaitable[None]],
+        workers: int = 2,
+        default_lang: str = "en",
+    ):
+        self.synthesize = synthesize
+        self.play = play
+        self.default_lang = default_lang
+        self.answer = ""
+        self.errors: List[BaseException] = []
+        self._stream = AnswerStream()
+        self._splitter = SentenceSplitter()
+        self._workers = asyncio.Semaphore(workers)
+        self._queue: "asyncio.Queue[Optional[asyncio.Task]]" = asyncio.Queue()
+        self._waiting: List[str] = []
+        self._tasks: List[asyncio.Task] = []
+        self._player = asyncio.create_task(self._play_loop())
+
+    @property
+    def lang(self) -> Optional[str]:
+        return self._stream.lang
+
+    def feed(self, chunk: str) -> str:
+        text = self._stream.feed(chunk)
+        self.answer += text
+        for sentence in self._splitter.feed(text):
+            self._submit(sentence)
+        return text
+
+    async def finish(self):
+        for sentence in self._splitter.flush():
+            self._submit(sentence)
+        if self._waiting:
+            self._submit_waiting(self.default_lang)
+        self._queue.put_nowait(None)
+        await self._player
+
+    async def cancel(self):
+        self._player.cancel()
+        # Includes the sentence the player had already taken off the queue.
+        for task in self._tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()
+
+    def _submit(self, sentence: str):
+        self._waiting.append(sentence)
+        # Hold sentences until the language is known, since it picks the voice.
+        if self.lang is not None:
+            self._submit_waiting(self.lang)
+
+    def _submit_waiting(self, lang: str):
+        for sentence in self._waiting:
+            task = asyncio.create_task(self._synthesize(sentence, lang))
+            self._tasks.append(task)
+            self._queue.put_nowait(task)
+        self._waiting = []
+
+    async def _synthesize(self, text: str, lang: str):
+        async with self._workers:
+            return await self.synthesize(text, lang)
+
+    async def _play_loop(self):
+        while True:
+            task = await self._queue.get()
+            if task is None:
+                return
+            try:
+                await self.play(await task)
+            except Exception as e:
+                # A sentence that fails to synthesize or play is skipped; the rest is still spoken.
+                self.errors.append(e)
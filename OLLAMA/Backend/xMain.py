@@ -1,7 +1,8 @@
-import asyncio, json
+import asyncio
 import modules.ollama.xGemma3_4b as xGemma
 import modules.ollama.xSTT as xSTT
 import modules.ollama.xTTS as xTTS
+from modules.ollama.xVoice import SpeechPipeline
 
 async def mic_chat():
     conversation_id = None
@@ -14,18 +15,38 @@ async def mic_chat():
       }
     }
     print("""Voice Chat started.""")
+    # The listener keeps capturing and recognizing while we generate and speak.
+    listener = xSTT.SpeechListener()
+    listener.start()
+
+    async def play(audio):
+        listener.pause()
+        try:
+            await xTTS.play(audio)
+        finally:
+            listener.resume()
+
     while True:
-        user_input = xSTT.recognize_speech_from_mic()
-        async for content, conversation_id in xGemma.chat(
-            message=user_input,
-            conversation_id=conversation_id,
-            instructions=instructions,
-            schema_props=schema,
-            stream=False
-        ):
-            print("Assistant:", content)
-            content_dict = json.loads(content)
-            await xTTS.speak(text=content_dict["answer"], lang=content_dict["lang"])
+        user_input = await listener.get()
+        if user_input is None:
+            break
+        # Sentences are spoken while the rest of the answer is still streaming.
+        pipeline = SpeechPipeline(xTTS.synthesize_async, play)
+        print("Assistant: ", end="", flush=True)
+        try:
+            async for content, conversation_id in xGemma.chat(
+                message=user_input,
+                conversation_id=conversation_id,
+                instructions=instructions,
+                schema_props=schema,
+                stream=True
+            ):
+                print(pipeline.feed(content), end="", flush=True)
+        except BaseException:
+            await pipeline.cancel()
+            raise
+        print()
+        await pipeline.finish()
 
 if __name__ == "__main__":
-    asyncio.run(mic_chat())
\ No newline at end of file
+    asyncio.run(mic_chat())
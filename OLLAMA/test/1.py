@@ -22,10 +22,11 @@ async def main():
     messages.append({'role': 'user', 'content': user_input})
     response = await client.chat('gemma3:4b-it-q4_K_M', messages=messages, stream=True)
 
+    assistant_content = ''
     async for chunk in response:
-        assistant_content = chunk['message']['content']
-        messages.append({'role': 'assistant', 'content': assistant_content})
-        print(assistant_content, end='', flush=True)
+        assistant_content += chunk['message']['content']
+        print(chunk['message']['content'], end='', flush=True)
+    messages.append({'role': 'assistant', 'content': assistant_content})
 
 if __name__ == '__main__':
   asyncio.run(main())
\ No newline at end of file
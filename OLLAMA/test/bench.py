@@ -0,0 +1,342 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Backend")
+sys.path.insert(0, BACKEND_DIR)
+
+# Metrics where a larger value is an improvement; everything else should go down.
+HIGHER_IS_BETTER = ("tokens_per_second",)
+
+
+class FakeOllama:
+    """Minimal HTTP/1.1 server speaking enough of the Ollama API for xGemma3_4b.
+
+    ``/api/chat`` answers after ``prefill`` seconds (plus ``prefill_per_kchar``
+    for every 1000 prompt characters) and then streams ``tokens`` NDJSON chunks
+    ``token_delay`` seconds apart, shaped to the requested JSON schema.
+    ``/image/<n>.jpg`` serves a fixed test image.
+    """
+
+    def __init__(self, tokens: int, token_delay: float, prefill: float, prefill_per_kchar: float, image: bytes):
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.prefill = prefill
+        self.prefill_per_kchar = prefill_per_kchar
+        self.image = image
+        self.requests = 0
+        self.server = None
+        self.port = None
+        self._connections = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        # Idle keep-alive connections would otherwise be cancelled mid-read by the server shutdown.
+        for writer in list(self._connections):
+            writer.close()
+        await asyncio.sleep(0)
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+                if method == "POST" and path == "/api/chat":
+                    await self._chat(json.loads(body), writer)
+                elif path.startswith("/image/"):
+                    await self._send(writer, 200, "image/jpeg", self.image)
+                else:
+                    await self._send(writer, 404, "application/json", b'{"error": "not found"}')
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _send(self, writer, status: int, content_type: str, data: bytes):
+        writer.write(
+            f"HTTP/1.1 {status} OK\r\nContent-Type: {content_type}\r\nContent-Length: {len(data)}\r\n\r\n".encode()
+            + data
+        )
+        await writer.drain()
+
+    def _pieces(self, schema) -> List[str]:
+        words = [f"word{i % 10}" + ("." if i % 8 == 7 else "") for i in range(self.tokens)]
+        if not isinstance(schema, dict):
+            return [w + " " for w in words]
+        head = {}
+        for name, prop in schema.get("properties", {}).items():
+            if name != "answer":
+                head[name] = prop.get("enum", ["x"])[0]
+        prefix = json.dumps(head)[:-1] + (", " if head else "") + '"answer": "'
+        return [prefix] + [w + " " for w in words] + ['"}']
+
+    async def _chat(self, request: Dict, writer):
+        started = time.perf_counter()
+        prompt_chars = sum(len(m.get("content", "")) for m in request.get("messages", []))
+        await asyncio.sleep(self.prefill + prompt_chars / 1000 * self.prefill_per_kchar)
+        prefilled = time.perf_counter()
+        pieces = self._pieces(request.get("format"))
+
+        def final(content: str) -> Dict:
+            now = time.perf_counter()
+            return {
+                "model": request.get("model", ""),
+                "created_at": "2024-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": content},
+                "done": True,
+                "done_reason": "stop",
+                "total_duration": int((now - started) * 1e9),
+                "prompt_eval_count": prompt_chars // 4,
+                "prompt_eval_duration": int((prefilled - started) * 1e9),
+                "eval_count": len(pieces),
+                "eval_duration": int((now - prefilled) * 1e9),
+            }
+
+        if not request.get("stream", True):
+            await asyncio.sleep(self.token_delay * len(pieces))
+            await self._send(writer, 200, "application/json", json.dumps(final("".join(pieces))).encode())
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+        def chunk(record: Dict):
+            data = (json.dumps(record) + "\n").encode()
+            writer.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+
+        for piece in pieces:
+            await asyncio.sleep(self.token_delay)
+            chunk({
+                "model": request.get("model", ""),
+                "created_at": "2024-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": piece},
+                "done": False,
+            })
+            await writer.drain()
+        chunk(final(""))
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def _test_image(size_kb: int) -> bytes:
+    try:
+        from PIL import Image
+    except ImportError:
+        return random.Random(0).randbytes(size_kb * 1024)
+    # A real photo-sized JPEG so the fetcher's downscaling path is exercised.
+    buffer = io.BytesIO()
+    Image.effect_noise((1600, 1200), 64).convert("RGB").save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def _rss_bytes() -> int:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        import resource
+        # Peak RSS; ru_maxrss is in KB on Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return 0
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_turn(xGemma, conv_id: str, message: str, image: Optional[str] = None, schema_props: Optional[Dict] = None) -> Dict:
+    from modules.ollama.xVoice import AnswerStream, SentenceSplitter
+
+    answer = AnswerStream()
+    splitter = SentenceSplitter()
+    started = time.perf_counter()
+    first = first_sentence = None
+    tokens = 0
+    async for content, _ in xGemma.chat(message, image=image, conversation_id=conv_id, schema_props=schema_props):
+        now = time.perf_counter()
+        if first is None:
+            first = now
+        tokens += 1
+        if first_sentence is None and splitter.feed(answer.feed(content)):
+            first_sentence = now
+    ended = time.perf_counter()
+    model_ns = (xGemma.turn_stats(conv_id) or {}).get("total_duration") or 0
+    return {
+        "ttft": first - started,
+        "first_sentence": first_sentence - started if first_sentence else None,
+        "tokens_per_second": tokens / (ended - first) if ended > first else None,
+        # Everything the turn spent outside the (fake) model: context building, I/O, scheduling.
+        "overhead": ended - started - model_ns / 1e9,
+    }
+
+
+async def scenario_long_history(xGemma, args) -> List[Dict]:
+    filler = "Tell me more about this topic, with details. " * 10
+    return [await run_turn(xGemma, "long", f"{i}: {filler}") for i in range(args.long_turns)]
+
+
+async def scenario_images(xGemma, args, port: int) -> List[Dict]:
+    # A handful of distinct URLs, so later turns hit the image cache.
+    return [
+        await run_turn(xGemma, "images", f"What is in picture {i}?", image=f"http://127.0.0.1:{port}/image/{i % 5}.jpg")
+        for i in range(args.image_turns)
+    ]
+
+
+async def scenario_concurrent(xGemma, args) -> List[Dict]:
+    async def conversation(index: int) -> List[Dict]:
+        return [await run_turn(xGemma, f"concurrent{index}", f"Question {turn}") for turn in range(args.turns)]
+
+    results = await asyncio.gather(*(conversation(i) for i in range(args.conversations)))
+    return [turn for turns in results for turn in turns]
+
+
+async def scenario_structured(xGemma, args) -> List[Dict]:
+    schema = {"lang": {"type": "string", "enum": ["en", "tr"], "description": "Detected language"}}
+    return [await run_turn(xGemma, "structured", f"Explain {i}", schema_props=schema) for i in range(args.turns)]
+
+
+def summarize(turns: List[Dict], wall: float) -> Dict:
+    result = {"turns": len(turns), "wall_seconds": wall}
+    for metric in ("ttft", "first_sentence", "tokens_per_second", "overhead"):
+        values = [t[metric] for t in turns if t[metric] is not None]
+        if values:
+            result[f"{metric}_p50"] = _percentile(values, 0.5)
+            result[f"{metric}_p95"] = _percentile(values, 0.95)
+    return result
+
+
+async def run(args) -> Dict:
+    server = FakeOllama(args.tokens, args.token_delay_ms / 1000, args.prefill_ms / 1000, args.prefill_ms_per_kchar / 1000, _test_image(args.image_kb))
+    await server.start()
+    # The ollama client reads OLLAMA_HOST when xGemma3_4b creates it at import.
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.port}"
+    import modules.ollama.xGemma3_4b as xGemma
+    from modules.ollama.xImages import ImageFetcher
+    from modules.ollama.xScheduler import Scheduler
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        xGemma._conv_manager.close()
+        xGemma._conv_manager = xGemma.ConversationManager(directory=os.path.join(directory, "conversations"))
+        xGemma._image_fetcher = ImageFetcher(os.path.join(directory, "image_cache"), max_side=896)
+        xGemma._scheduler = Scheduler(default_limit=args.parallel, max_queue=args.conversations * args.turns)
+
+        scenarios = {
+            "long_history": lambda: scenario_long_history(xGemma, args),
+            "images": lambda: scenario_images(xGemma, args, server.port),
+            "concurrent": lambda: scenario_concurrent(xGemma, args),
+            "structured": lambda: scenario_structured(xGemma, args),
+        }
+        for name in args.scenario or scenarios:
+            disk_before = _dir_bytes(directory)
+            rss_before = _rss_bytes()
+            started = time.perf_counter()
+            turns = await scenarios[name]()
+            wall = time.perf_counter() - started
+            xGemma._conv_manager.flush()
+            results[name] = summarize(turns, wall)
+            results[name]["disk_bytes"] = _dir_bytes(directory) - disk_before
+            results[name]["rss_growth_bytes"] = _rss_bytes() - rss_before
+            print(f"{name}: " + ", ".join(f"{k}={v:.4f}" if isinstance(v, float) else f"{k}={v}" for k, v in results[name].items()))
+        xGemma._conv_manager.close()
+        await xGemma._image_fetcher.aclose()
+    await server.close()
+    return results
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> bool:
+    regressed = False
+    for name, metrics in current["scenarios"].items():
+        old_metrics = baseline.get("scenarios", {}).get(name)
+        if not old_metrics:
+            continue
+        print(f"\n{name}")
+        for metric, value in metrics.items():
+            old = old_metrics.get(metric)
+            if metric == "turns" or not old or value is None:
+                continue
+            change = (value - old) / old
+            worse = -change if metric.startswith(HIGHER_IS_BETTER) else change
+            flag = ""
+            if worse > threshold:
+                flag = "  REGRESSION"
+                regressed = True
+            print(f"  {metric:<24} {old:>12.4f} -> {value:>12.4f}  {change:+.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark xGemma3_4b.chat against a fake Ollama server")
+    parser.add_argument("--scenario", action="append", choices=["long_history", "images", "concurrent", "structured"],
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens per reply")
+    parser.add_argument("--token-delay-ms", type=float, default=2)
+    parser.add_argument("--prefill-ms", type=float, default=10)
+    parser.add_argument("--prefill-ms-per-kchar", type=float, default=1)
+    parser.add_argument("--long-turns", type=int, default=200)
+    parser.add_argument("--image-turns", type=int, default=20)
+    parser.add_argument("--image-kb", type=int, default=256, help="Size of the test image when Pillow is missing")
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=5, help="Turns per conversation")
+    parser.add_argument("--parallel", type=int, default=4, help="Scheduler slots per model")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "compare", "threshold")}
+    results = {"config": config, "scenarios": asyncio.run(run(args))}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Backend"))
+
+import modules.ollama.xGemma3_4b as xGemma
+from modules.ollama.xScheduler import ConversationBusy, Scheduler
+
+CONVERSATIONS = 50
+TURNS_PER_CONVERSATION = 40
+
+
+class FakeClient:
+    def __init__(self):
+        self.active = {}
+        self.overlaps = 0
+
+    async def chat(self, model, messages, stream, format, **kwargs):
+        conv_id = messages[-1]["content"].split(":")[0]
+        # The prompt must contain every earlier turn of this conversation.
+        expected = 2 * int(messages[-1]["content"].split(":")[1]) + 2
+        assert len(messages) == expected, (conv_id, len(messages), expected)
+
+        async def generate():
+            if self.active.get(conv_id):
+                self.overlaps += 1
+            self.active[conv_id] = True
+            try:
+                for token in ("ok", " ", conv_id):
+                    await asyncio.sleep(random.random() / 1000)
+                    yield {"message": {"content": token}}
+                yield {"done": True, "message": {"content": ""}, "eval_count": 3, "eval_duration": 1_000_000}
+            finally:
+                self.active[conv_id] = False
+        return generate()
+
+
+async def turn(conv_id: str, index: int, on_busy: str = "wait") -> str:
+    answer = ""
+    async for content, _ in xGemma.chat(f"{conv_id}:{index}", conversation_id=conv_id, on_busy=on_busy):
+        answer += content
+    return answer
+
+
+async def main():
+    fake = FakeClient()
+    xGemma._client = fake
+    xGemma._scheduler = Scheduler(default_limit=8, max_queue=CONVERSATIONS * TURNS_PER_CONVERSATION)
+    with tempfile.TemporaryDirectory() as directory:
+        xGemma._conv_manager = xGemma.ConversationManager(max_size_bytes=10_000_000, directory=directory)
+        conv_ids = [f"stress{i}" for i in range(CONVERSATIONS)]
+
+        # Turns reach a conversation's lock in the order they are numbered here.
+        counters = {conv_id: 0 for conv_id in conv_ids}
+
+        async def numbered_turn(conv_id):
+            index = counters[conv_id]
+            counters[conv_id] += 1
+            return await turn(conv_id, index)
+
+        jobs = [numbered_turn(c) for c in conv_ids for _ in range(TURNS_PER_CONVERSATION)]
+        random.shuffle(jobs)
+        await asyncio.gather(*jobs)
+
+        lost = 0
+        for conv_id in conv_ids:
+            history = xGemma._conv_manager.get_conversation(conv_id)["history"]
+            users = [m["content"] for m in history if m["role"] == "user"]
+            lost += TURNS_PER_CONVERSATION - len(users)
+            assert users == [f"{conv_id}:{i}" for i in range(TURNS_PER_CONVERSATION)], conv_id
+
+        results = await asyncio.gather(
+            turn("busy", 0),
+            *[turn("busy", 1, on_busy="reject") for _ in range(5)],
+            return_exceptions=True,
+        )
+        busy = sum(isinstance(r, ConversationBusy) for r in results)
+        xGemma._conv_manager.close()
+
+    print(f"Turns: {len(jobs)}, lost: {lost}, overlapping turns: {fake.overlaps}, rejected while busy: {busy}")
+    print(xGemma.scheduler_stats())
+    assert lost == 0
+    assert fake.overlaps == 0
+    assert busy == 5
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
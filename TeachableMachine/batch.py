@@ -0,0 +1,203 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+import cv2  # Install opencv-python
+import numpy as np
+from main import IMAGE_EXTENSIONS, IMAGE_SIZE, TFLITE_MODEL_PATH, load_labels, select_model
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Frames per video decode task; each task seeks once, so ranges are kept long.
+VIDEO_RANGE = 64
+
+
+def _init_worker():
+    # One OpenCV thread per process; the pool provides the parallelism.
+    cv2.setNumThreads(1)
+
+
+def _resize(image):
+    return cv2.resize(image, (IMAGE_SIZE, IMAGE_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def _decode(paths):
+    results = []
+    for path in paths:
+        image = cv2.imread(path)
+        results.append((path, None if image is None else _resize(image)))
+    return results
+
+
+def _video_frames(path, start=0, count=None):
+    video = cv2.VideoCapture(path)
+    if start:
+        video.set(cv2.CAP_PROP_POS_FRAMES, start)
+    index = start
+    try:
+        while count is None or index < start + count:
+            ret, frame = video.read()
+            if not ret:
+                break
+            # Resized right away: only small frames are kept or sent between processes.
+            yield f"{path}#{index}", _resize(frame)
+            index += 1
+    finally:
+        video.release()
+
+
+def _decode_video(args):
+    path, start, count = args
+    return list(_video_frames(path, start, count))
+
+
+def _bounded(pool, func, tasks, limit):
+    # At most `limit` tasks are queued or finished-but-unconsumed, so a slow model
+    # applies backpressure instead of decoded images piling up in memory.
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= limit:
+            yield from pending.popleft().get()
+    while pending:
+        yield from pending.popleft().get()
+
+
+def iter_images(source, pool, chunksize, in_flight):
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in sorted(os.listdir(source))
+                 if name.lower().endswith(IMAGE_EXTENSIONS)]
+        chunks = (paths[i:i + chunksize] for i in range(0, len(paths), chunksize))
+        return _bounded(pool, _decode, chunks, in_flight)
+    video = cv2.VideoCapture(source)
+    frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+    if frames <= 0:
+        # Unknown length (e.g. a stream): decode in order in this process.
+        return _video_frames(source)
+    # Each worker decodes its own frame range. The frame count may only be estimated
+    # from duration x fps, so the last range reads on to the end of the file.
+    starts = range(0, frames, VIDEO_RANGE)
+    ranges = ((source, start, VIDEO_RANGE if start != starts[-1] else None) for start in starts)
+    return _bounded(pool, _decode_video, ranges, in_flight)
+
+
+def iter_batches(items, batch_size):
+    batch = []
+    for name, image in items:
+        if image is None:
+            print(f"Skipping unreadable image: {name}")
+            continue
+        batch.append((name, image))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class PredictionWriter:
+    def __init__(self, path, top_k):
+        self.top_k = top_k
+        self.csv = path.lower().endswith(".csv")
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        if self.csv:
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(["input", "label", "confidence", "top_k"])
+
+    def write(self, names, predictions, labels):
+        top = np.argsort(predictions, axis=1)[:, ::-1][:, :self.top_k]
+        for name, prediction, indices in zip(names, predictions, top):
+            top_k = [[labels[i], round(float(prediction[i]), 6)] for i in indices]
+            if self.csv:
+                self._writer.writerow([name, top_k[0][0], top_k[0][1], json.dumps(top_k, ensure_ascii=False)])
+            else:
+                row = {"input": name, "label": top_k[0][0], "confidence": top_k[0][1], "top_k": top_k}
+                self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        # Results are on disk as soon as each batch is done.
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def peak_memory_mb(who="self"):
+    if resource is None:
+        return None
+    # RUSAGE_CHILDREN reports the largest peak among finished, reaped workers.
+    peak = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS.
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify a folder of images or a video file in batches")
+    parser.add_argument("source", help="Image folder or video file")
+    parser.add_argument("--output", default="predictions.jsonl", help=".jsonl or .csv")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--in-flight", type=int, help="Decode tasks queued ahead of the model (default: 2 per worker)")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--backend", choices=["auto", "tf", "tflite"], default="auto")
+    parser.add_argument("--tflite-model", default=TFLITE_MODEL_PATH)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--cpu", action="store_true")
+    parser.add_argument("--stats", help="Also write the benchmark summary to this JSON file")
+    args = parser.parse_args()
+
+    labels = load_labels()
+    model = select_model(args.backend, args.cpu, args.tflite_model, args.threads)
+    batch = np.empty((args.batch_size, IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.float32)
+    writer = PredictionWriter(args.output, min(args.top_k, len(labels)))
+    latencies = []
+    images = 0
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.workers, initializer=_init_worker) as pool:
+        chunksize = max(1, args.batch_size // args.workers)
+        in_flight = args.in_flight or 2 * args.workers
+        for items in iter_batches(iter_images(args.source, pool, chunksize, in_flight), args.batch_size):
+            count = len(items)
+            inputs = batch[:count]
+            np.multiply(np.stack([image for _, image in items]), 1 / 127.5, out=inputs, casting="unsafe")
+            np.subtract(inputs, 1.0, out=inputs)
+
+            started = time.perf_counter()
+            predictions = np.asarray(model(inputs))
+            latencies.append((time.perf_counter() - started) / count)
+
+            writer.write([name for name, _ in items], predictions, labels)
+            images += count
+        # Reap the workers so their peak memory shows up in RUSAGE_CHILDREN.
+        pool.close()
+        pool.join()
+    elapsed = time.perf_counter() - start
+    writer.close()
+
+    stats = {
+        "images": images,
+        "seconds": round(elapsed, 3),
+        "images_per_s": round(images / elapsed, 2) if elapsed else None,
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)) * 1000, 3) if latencies else None,
+        "latency_ms_p99": round(float(np.percentile(latencies, 99)) * 1000, 3) if latencies else None,
+        "peak_memory_mb": peak_memory_mb(),
+        "peak_worker_memory_mb": peak_memory_mb("children"),
+        "batch_size": args.batch_size,
+        "workers": args.workers,
+        "backend": args.backend,
+    }
+    print(json.dumps(stats, indent=2))
+    if args.stats:
+        with open(args.stats, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import os
+import time
+import cv2  # Install opencv-python
+import numpy as np
+from main import (IMAGE_EXTENSIONS, KERAS_MODEL_PATH, SAVED_MODEL_PATH, TFLITE_MODEL_PATH, Preprocessor,
+                  load_keras, load_labels, load_tf_model, load_tflite_model, select_source)
+
+
+def load_samples(folder):
+    preprocess = Preprocessor(1)
+    samples = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image = cv2.imread(os.path.join(folder, name))
+        if image is not None:
+            samples.append((name, preprocess([image]).copy()))
+    return samples
+
+
+def convert(output, quantize, samples, source="keras"):
+    import tensorflow as tf  # TensorFlow is required
+
+    if source == "keras":
+        converter = tf.lite.TFLiteConverter.from_keras_model(load_keras(KERAS_MODEL_PATH))
+    else:
+        converter = tf.lite.TFLiteConverter.from_saved_model(SAVED_MODEL_PATH)
+    if quantize != "none":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        if not samples:
+            raise SystemExit("int8 quantization needs sample images for calibration (--samples)")
+        # Calibrate activation ranges on real images; input and output stay float32.
+        converter.representative_dataset = lambda: ([image] for _, image in samples)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "wb") as f:
+        f.write(converter.convert())
+    print(f"Wrote {output} ({os.path.getsize(output) / 1024:.0f} KB)")
+
+
+def true_label(name, class_names):
+    # Samples are named after their class, e.g. sise1.png; longest match wins for sise1 vs sise10.
+    stem = os.path.splitext(name)[0].lower()
+    matches = [i for i, label in enumerate(class_names) if stem.startswith(label.lower())]
+    return max(matches, key=lambda i: len(class_names[i])) if matches else None
+
+
+def report(samples, models, class_names, repeats=20):
+    reference = None
+    labels = [true_label(name, class_names) for name, _ in samples]
+    labelled = [i for i, label in enumerate(labels) if label is not None]
+    print(f"{'backend':<12}{'ms/image':>10}{'top-1 acc':>11}{'top-1 agree':>14}{'max |dp|':>10}")
+    for name, model in models.items():
+        model(samples[0][1])  # warm up
+        predictions = []
+        start = time.perf_counter()
+        for _ in range(repeats):
+            predictions = [model(image)[0] for _, image in samples]
+        elapsed = (time.perf_counter() - start) / (repeats * len(samples))
+        predictions = np.array(predictions)
+        if reference is None:
+            reference = predictions
+        agree = np.mean(predictions.argmax(axis=1) == reference.argmax(axis=1))
+        diff = np.abs(predictions - reference).max()
+        if labelled:
+            correct = sum(int(predictions[i].argmax()) == labels[i] for i in labelled)
+            accuracy = f"{correct / len(labelled) * 100:>10.0f}%"
+        else:
+            accuracy = f"{'n/a':>11}"
+        print(f"{name:<12}{elapsed * 1000:>10.2f}{accuracy}{agree * 100:>13.0f}%{diff:>10.4f}")
+    if labelled:
+        print(f"Accuracy over {len(labelled)} of {len(samples)} samples whose file name matches a label")
+    for (sample, _), prediction in zip(samples, reference):
+        print(f"{sample}: {class_names[int(np.argmax(prediction))]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the Teachable Machine model to TFLite and compare backends")
+    parser.add_argument("--quantize", choices=["none", "dynamic", "float16", "int8"], default="int8")
+    parser.add_argument("--output", default=TFLITE_MODEL_PATH)
+    parser.add_argument("--samples", default=".", help="Folder of sample images (e.g. sise1.png, sise2.png)")
+    parser.add_argument("--source", choices=["auto", "keras", "savedmodel"], default="auto",
+                        help="Model to export and compare against (auto: SavedModel if complete, else keras_model.h5)")
+    parser.add_argument("--report-only", action="store_true", help="Skip the export and only compare")
+    parser.add_argument("--threads", type=int)
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    source = select_source(args.source)
+    if not args.report_only:
+        convert(args.output, args.quantize, samples, source)
+    if not samples:
+        return
+
+    class_names = load_labels()
+    models = {"tf": load_tf_model(source, cpu=True)}
+    models["tflite"] = load_tflite_model(args.output, args.threads)
+    report(samples, models, class_names)
+
+
+if __name__ == "__main__":
+    main()
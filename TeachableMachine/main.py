@@ -1,51 +1,275 @@
-import tensorflow as tf  # TensorFlow is required
+import argparse
+import os
+import queue
+import threading
 import cv2  # Install opencv-python
 import numpy as np
 
 # Disable scientific notation for clarity
 np.set_printoptions(suppress=True)
 
-# Load the SavedModel
-model = tf.saved_model.load("model/savedmodel/model.savedmodel")
+IMAGE_SIZE = 224
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+SAVED_MODEL_PATH = "model/savedmodel/model.savedmodel"
+KERAS_MODEL_PATH = "model/keras/keras_model.h5"
+TFLITE_MODEL_PATH = "model/tflite/model.tflite"
 
-# Load the labels
-class_names = open("model/savedmodel/labels.txt", "r").readlines()
 
-# CAMERA can be 0 or 1 based on default camera of your computer
-camera = cv2.VideoCapture(0)
+def load_model(path=SAVED_MODEL_PATH, cpu=False):
+    import tensorflow as tf  # TensorFlow is required
 
-while True:
-    # Grab the webcamera's image.
-    ret, image = camera.read()
+    if cpu:
+        tf.config.set_visible_devices([], "GPU")
 
-    # Resize the raw image into (224-height,224-width) pixels
-    image = cv2.resize(image, (224, 224), interpolation=cv2.INTER_AREA)
+    # Load the SavedModel
+    model = tf.saved_model.load(path)
 
-    # Show the image in a window
-    cv2.imshow("Webcam Image", image)
+    # Trace the model once for a fixed input signature instead of running it eagerly per frame.
+    # The batch dimension is left open so frames from several sources can share one call.
+    infer = tf.function(
+        lambda images: model(images),
+        input_signature=[tf.TensorSpec([None, IMAGE_SIZE, IMAGE_SIZE, 3], tf.float32)],
+    )
+    return lambda batch: infer(batch).numpy()
 
-    # Make the image a numpy array and reshape it to the models input shape.
-    image = np.asarray(image, dtype=np.float32).reshape(1, 224, 224, 3)
 
-    # Normalize the image array
-    image = (image / 127.5) - 1
+def load_keras(path=KERAS_MODEL_PATH):
+    import tensorflow as tf  # TensorFlow is required
 
-    # Predicts the model using SavedModel
-    prediction = model(image)
-    index = np.argmax(prediction)
-    class_name = class_names[index]
-    confidence_score = prediction[0][index]
+    class DepthwiseConv2D(tf.keras.layers.DepthwiseConv2D):
+        # Teachable Machine exports pass `groups`, which newer Keras versions reject.
+        def __init__(self, *args, groups=None, **kwargs):
+            super().__init__(*args, **kwargs)
 
-    # Print prediction and confidence score
-    print("Class:", class_name[2:], end="")
-    print("Confidence Score:", str(np.round(confidence_score * 100))[:-2], "%")
+    return tf.keras.models.load_model(path, compile=False, custom_objects={"DepthwiseConv2D": DepthwiseConv2D})
 
-    # Listen to the keyboard for presses.
-    keyboard_input = cv2.waitKey(1)
 
-    # 27 is the ASCII for the esc key on your keyboard.
-    if keyboard_input == 27:
-        break
+def load_keras_model(path=KERAS_MODEL_PATH, cpu=False):
+    import tensorflow as tf  # TensorFlow is required
 
-camera.release()
-cv2.destroyAllWindows()
+    if cpu:
+        tf.config.set_visible_devices([], "GPU")
+
+    model = load_keras(path)
+    infer = tf.function(
+        lambda images: model(images, training=False),
+        input_signature=[tf.TensorSpec([None, IMAGE_SIZE, IMAGE_SIZE, 3], tf.float32)],
+    )
+    return lambda batch: infer(batch).numpy()
+
+
+def load_labels(path="model/savedmodel/labels.txt"):
+    # Lines look like "0 sise1"; index them by the number instead of slicing characters off.
+    labels = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                index, name = line.strip().split(" ", 1)
+                labels[int(index)] = name
+    return [labels[i] for i in range(len(labels))]
+
+
+def _tflite_interpreter():
+    # Prefer the standalone runtime: it avoids importing all of TensorFlow.
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+def load_tflite_model(path=TFLITE_MODEL_PATH, num_threads=None):
+    interpreter = _tflite_interpreter()(model_path=path, num_threads=num_threads or os.cpu_count())
+    interpreter.allocate_tensors()
+    input_index = interpreter.get_input_details()[0]["index"]
+    output_index = interpreter.get_output_details()[0]["index"]
+    batch_size = [interpreter.get_input_details()[0]["shape"][0]]
+
+    def predict(batch):
+        if batch.shape[0] != batch_size[0]:
+            interpreter.resize_tensor_input(input_index, list(batch.shape))
+            interpreter.allocate_tensors()
+            batch_size[0] = batch.shape[0]
+        interpreter.set_tensor(input_index, batch)
+        interpreter.invoke()
+        return interpreter.get_tensor(output_index).copy()
+
+    return predict
+
+
+def select_source(source="auto"):
+    if source == "auto":
+        # The SavedModel export is only usable when its graph (saved_model.pb) is present.
+        has_graph = os.path.exists(os.path.join(SAVED_MODEL_PATH, "saved_model.pb"))
+        return "savedmodel" if has_graph else "keras"
+    return source
+
+
+def load_tf_model(source="auto", cpu=False):
+    return load_keras_model(cpu=cpu) if select_source(source) == "keras" else load_model(cpu=cpu)
+
+
+def select_model(backend="auto", cpu=False, tflite_path=TFLITE_MODEL_PATH, num_threads=None):
+    if backend == "tflite" or (backend == "auto" and os.path.exists(tflite_path)):
+        return load_tflite_model(tflite_path, num_threads)
+    return load_tf_model(cpu=cpu)
+
+
+class FrameSource:
+    """Reads frames on its own thread.
+
+    Cameras keep only the newest frame so the model never works on stale
+    images; video files and image folders hand over every frame in order.
+    """
+
+    def __init__(self, spec):
+        self.name = str(spec)
+        self.live = str(spec).isdigit()
+        self._frames = queue.Queue(maxsize=1)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(spec,), daemon=True)
+        self._thread.start()
+
+    def _run(self, spec):
+        try:
+            if os.path.isdir(spec):
+                for name in sorted(os.listdir(spec)):
+                    if self._stop.is_set():
+                        break
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        image = cv2.imread(os.path.join(spec, name))
+                        if image is not None:
+                            self._put(image)
+                return
+            # CAMERA can be 0 or 1 based on default camera of your computer
+            camera = cv2.VideoCapture(int(spec) if self.live else spec)
+            try:
+                while not self._stop.is_set():
+                    # Grab the webcamera's image.
+                    ret, image = camera.read()
+                    if not ret:
+                        break
+                    self._put(image)
+            finally:
+                camera.release()
+        finally:
+            self._frames.put(None)
+
+    def _put(self, image):
+        if self.live:
+            try:
+                self._frames.get_nowait()
+            except queue.Empty:
+                pass
+            self._frames.put(image)
+        else:
+            while not self._stop.is_set():
+                try:
+                    self._frames.put(image, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+    def read(self):
+        return self._frames.get()
+
+    def stop(self):
+        self._stop.set()
+
+
+class Preprocessor:
+    """Resizes and normalizes frames into buffers allocated once up front."""
+
+    def __init__(self, batch_size):
+        self.resized = np.empty((batch_size, IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.uint8)
+        self.batch = np.empty((batch_size, IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.float32)
+
+    def __call__(self, frames):
+        count = len(frames)
+        for i, frame in enumerate(frames):
+            # Resize the raw image into (224-height,224-width) pixels
+            cv2.resize(frame, (IMAGE_SIZE, IMAGE_SIZE), dst=self.resized[i], interpolation=cv2.INTER_AREA)
+        # Normalize the image array into [-1, 1] in place
+        batch = self.batch[:count]
+        np.multiply(self.resized[:count], 1 / 127.5, out=batch, casting="unsafe")
+        np.subtract(batch, 1.0, out=batch)
+        return batch
+
+
+def run(sources, model, class_names, display=True):
+    sources = [FrameSource(spec) for spec in sources]
+    preprocess = Preprocessor(len(sources))
+    active = list(sources)
+
+    while active:
+        # Micro-batch the latest frame of every source into one model call
+        frames = []
+        batch_sources = []
+        for source in list(active):
+            image = source.read()
+            if image is None:
+                active.remove(source)
+                continue
+            frames.append(image)
+            batch_sources.append(source)
+        if not frames:
+            break
+
+        batch = preprocess(frames)
+
+        # Predicts the model
+        predictions = model(batch)
+
+        for i, source in enumerate(batch_sources):
+            if display:
+                # Show the image in a window
+                cv2.imshow(source.name, preprocess.resized[i])
+            index = np.argmax(predictions[i])
+            class_name = class_names[index]
+            confidence_score = predictions[i][index]
+
+            # Print prediction and confidence score
+            print(f"[{source.name}] Class:", class_name)
+            print("Confidence Score:", str(np.round(confidence_score * 100))[:-2], "%")
+
+        # Listen to the keyboard for presses.
+        keyboard_input = cv2.waitKey(1) if display else -1
+
+        # 27 is the ASCII for the esc key on your keyboard.
+        if keyboard_input == 27:
+            break
+
+    for source in sources:
+        source.stop()
+    if display:
+        cv2.destroyAllWindows()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teachable Machine classifier")
+    parser.add_argument("--source", action="append", help="Camera index, video file or image folder (repeatable)")
+    parser.add_argument("--cpu", action="store_true", help="Run on CPU only")
+    parser.add_argument("--backend", choices=["auto", "tf", "tflite"], default="auto",
+                        help="auto uses the TFLite model when it has been exported (see convert.py); tf uses the SavedModel if complete, else keras_model.h5")
+    parser.add_argument("--tflite-model", default=TFLITE_MODEL_PATH)
+    parser.add_argument("--threads", type=int, help="TFLite CPU threads (default: all cores)")
+    parser.add_argument("--no-display", action="store_true", help="Do not open preview windows")
+    args = parser.parse_args()
+
+    model = select_model(args.backend, args.cpu, args.tflite_model, args.threads)
+
+    # Load the labels
+    class_names = load_labels()
+
+    run(args.source or ["0"], model, class_names, display=not args.no_display)
+
+
+if __name__ == "__main__":
+    main()